@@ -1,101 +1,230 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import distinct
-
-from app.db.get_db import get_db
-from app.models.models import (
-    Employers,
-    Positions,
-    Departments,
-    Projects,
-    Technologies,
-    Interests, NotificationsEmployees, Notifications,
-)
+import asyncio
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Security
+from fastapi.responses import StreamingResponse
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from sqlalchemy import select, exists
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.get_db import get_async_db, get_async_read_db
+from app.models.models import Cities, Employers, Events
 from app.schemas.schemas import PositionRead, DepartmentRead, TechnologyRead, InterestsRead, ProjectRead, \
-    TechnologySoloRead, NotificationReadRequest, NotificationOut
-from app.services.user_service import get_current_user
+    TechnologySoloRead, BroadcastCreate, NotificationReadRequest, NotificationOut, NotificationPage, UnreadCount, \
+    CityRead, NotificationStreamToken
+from app.core.config import settings
+from app.services.notification_hub import notification_hub, format_event, stream_token, check_stream_token
+from app.services.notification_service import (
+    list_notifications, count_unread, mark_read, broadcast_notification
+)
+from app.services.reference_cache import reference_cache
+from app.services.revocation_store import revocation_store
+from app.services.user_service import get_current_user, has_system_role
 
 router = APIRouter(prefix='/common', tags=['Common'])
 
+# поток уведомлений принимает и заголовок, и ?token=: заголовок необязателен
+optional_bearer = HTTPBearer(auto_error=False)
+
+# размер страницы, которыми прежний GET /common/notifications собирает полный список
+LEGACY_PAGE_SIZE = 500
+
 
 @router.get("/cities", response_model=List[str])
-async def list_cities(db: Session = Depends(get_db)):
-    rows = db.query(distinct(Employers.city)).order_by(Employers.city).all()
-    return [city for (city,) in rows]
+async def list_cities(db: AsyncSession = Depends(get_async_read_db)):
+    rows = await db.scalars(select(Cities.name_city).where(Cities.headcount > 0).order_by(Cities.name_city))
+    return rows.all()
+
+
+@router.get("/cities/headcount", response_model=List[CityRead])
+async def list_cities_headcount(db: AsyncSession = Depends(get_async_read_db)):
+    return (await db.scalars(select(Cities).where(Cities.headcount > 0).order_by(Cities.name_city))).all()
 
 
 @router.get("/positions", response_model=List[PositionRead])
-async def list_positions(db: Session = Depends(get_db)):
-    positions = db.query(Positions).order_by(Positions.position_name).all()
-    return positions
+async def list_positions(db: AsyncSession = Depends(get_async_read_db)):
+    return await reference_cache.arows(db, "positions")
 
 
 @router.get("/departments", response_model=List[DepartmentRead])
-async def list_departments(db: Session = Depends(get_db)):
-    depts = db.query(Departments).order_by(Departments.name_department).all()
-    return depts
+async def list_departments(db: AsyncSession = Depends(get_async_read_db)):
+    return await reference_cache.arows(db, "departments")
 
 
 @router.get("/projects", response_model=List[ProjectRead])
-async def list_projects(db: Session = Depends(get_db)):
-    projs = db.query(Projects).order_by(Projects.name_project).all()
-    return projs
+async def list_projects(db: AsyncSession = Depends(get_async_read_db)):
+    return await reference_cache.arows(db, "projects")
 
 
 @router.get("/technologies", response_model=List[TechnologySoloRead])
-async def list_technologies(db: Session = Depends(get_db)):
-    techs = db.query(Technologies).order_by(Technologies.name_technology).all()
-    return techs
+async def list_technologies(db: AsyncSession = Depends(get_async_read_db)):
+    return await reference_cache.arows(db, "technologies")
 
 
 @router.get("/interests", response_model=List[InterestsRead])
-async def list_interests(db: Session = Depends(get_db)):
-    ints = db.query(Interests).order_by(Interests.name_interest).all()
-    return ints
+async def list_interests(db: AsyncSession = Depends(get_async_read_db)):
+    return await reference_cache.arows(db, "interests")
 
 
 @router.get(
     "/notifications",
     response_model=List[NotificationOut],
+    deprecated=True,
     summary="Получить все уведомления для сотрудника (с флагом прочитано/непрочитано)"
 )
+async def get_all_notifications_for_employee(
+    user_data: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Прежний формат ответа — список всех уведомлений сотрудника целиком, от новых к старым.
+    Оставлен для существующих клиентов; новым следует использовать GET /common/notifications/feed.
+    """
+    employee_id = user_data["employee"].id_employee
+    items, cursor = [], None
+    while True:
+        page = await list_notifications(db, employee_id, limit=LEGACY_PAGE_SIZE, cursor=cursor)
+        items.extend(page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return items
+
+
+@router.get(
+    "/notifications/feed",
+    response_model=NotificationPage,
+    summary="Уведомления сотрудника от новых к старым, постранично (cursor)"
+)
 async def get_notifications_for_employee(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor из предыдущей страницы"),
+    unread_only: bool = Query(False),
     user_data: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Возвращает список всех уведомлений конкретного сотрудника.
+    Возвращает страницу уведомлений сотрудника.
     Для каждого уведомления возвращаются:
       - id (UUID)
       - content (строка)
       - is_shown (булево — прочитано/нет)
+      - created_at (время создания)
+    Если next_cursor не пуст, следующая страница запрашивается с cursor=next_cursor.
+    """
+    return await list_notifications(
+        db, user_data["employee"].id_employee, limit=limit, cursor=cursor, unread_only=unread_only
+    )
+
+
+@router.get(
+    "/notifications/unread-count",
+    response_model=UnreadCount,
+    summary="Число непрочитанных уведомлений сотрудника"
+)
+async def get_unread_notifications_count(
+    user_data: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    return UnreadCount(unread=await count_unread(db, user_data["employee"].id_employee))
+
+
+@router.get(
+    "/notifications/stream-token",
+    response_model=NotificationStreamToken,
+    summary="Токен для подключения к потоку уведомлений через EventSource"
+)
+async def get_stream_token(user_data: dict = Depends(get_current_user)):
+    return NotificationStreamToken(
+        token=stream_token(user_data["employee"].id_employee, user_data["token_id"]),
+        expires_in=settings.NOTIFICATION_STREAM_TOKEN_SECONDS
+    )
+
+
+@router.get(
+    "/notifications/stream",
+    summary="Поток новых уведомлений сотрудника (Server-Sent Events)"
+)
+async def stream_notifications(
+    request: Request,
+    token: Optional[str] = Query(None, description="Токен из GET /common/notifications/stream-token"),
+    credentials: Optional[HTTPAuthorizationCredentials] = Security(optional_bearer),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Держит соединение открытым и присылает событие `notification` с полями id, content, is_shown, created_at
+    для каждого нового уведомления; раз в NOTIFICATION_STREAM_KEEPALIVE_SECONDS — комментарий keep-alive.
+    Уже существующие уведомления отдаёт GET /common/notifications/feed.
+    Авторизация — заголовком Authorization или, для EventSource, параметром token.
+    """
+    if token:
+        employee_id, jti = check_stream_token(token)
+        # сессия, выдавшая токен, могла завершиться, а сотрудник — быть удалён за время жизни токена
+        if await db.run_sync(revocation_store.is_revoked, jti):
+            raise HTTPException(status_code=401, detail="Token has been revoked")
+        if not await db.scalar(select(exists().where(Employers.id_employee == employee_id))):
+            raise HTTPException(status_code=401, detail="User not found")
+    elif credentials:
+        employee_id = (await get_current_user(credentials, db))["employee"].id_employee
+    else:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    # соединение из пула не держим на всё время потока
+    await db.close()
+
+    async def events():
+        queue = notification_hub.subscribe(employee_id)
+        try:
+            yield f"retry: {settings.NOTIFICATION_STREAM_KEEPALIVE_SECONDS * 1000}\n\n"
+            while not await request.is_disconnected():
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=settings.NOTIFICATION_STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_event(message)
+        finally:
+            notification_hub.unsubscribe(employee_id, queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post(
+    "/notifications/broadcast",
+    summary="Рассылка уведомления всем сотрудникам, отделу, проекту или участникам мероприятия"
+)
+async def create_broadcast_notification(
+    payload: BroadcastCreate,
+    user_data: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Сохраняет уведомление один раз с правилом аудитории; строки получателей не создаются,
+    поэтому стоимость не зависит от размера аудитории.
+    Разрешено ролям из BROADCAST_ROLE_NAMES, а организатору мероприятия — только его участникам.
     """
-    exists_emp = db.query(Employers).filter(Employers.id_employee == user_data["employee"].id_employee).first()
-    if not exists_emp:
-        raise HTTPException(status_code=404, detail="Employee not found")
-
-    rows = (
-        db.query(Notifications, NotificationsEmployees.is_shown)
-          .join(
-              NotificationsEmployees,
-              Notifications.id == NotificationsEmployees.id_notification
-          )
-          .filter(NotificationsEmployees.id_employee == user_data["employee"].id_employee)
-          .order_by(Notifications.id)
-          .all()
+    principal = user_data["employee"]
+    privileged = await has_system_role(
+        db, principal.role_id, [name.strip() for name in settings.BROADCAST_ROLE_NAMES.split(",") if name.strip()]
     )
 
-    result: List[NotificationOut] = []
-    for notif, is_shown in rows:
-        result.append(
-            NotificationOut(
-                id=notif.id,
-                content=notif.content,
-                is_shown=is_shown
-            )
-        )
-    return result
+    if payload.audience == "department":
+        found = await reference_cache.alookup(db, "departments", payload.audience_id)
+    elif payload.audience == "project":
+        found = await reference_cache.alookup(db, "projects", payload.audience_id)
+    elif payload.audience == "event":
+        found = await db.get(Events, payload.audience_id)
+    else:
+        found = True
+    if not found:
+        raise HTTPException(status_code=404, detail="Аудитория рассылки не найдена")
+    if not privileged and not (payload.audience == "event" and found.id_owner == principal.id_employee):
+        raise HTTPException(status_code=403, detail="Нет прав на рассылку этой аудитории")
+
+    notification_id = await broadcast_notification(db, payload.content, payload.audience, payload.audience_id)
+    await db.commit()
+    return {"id": notification_id}
 
 
 @router.post(
@@ -105,34 +234,28 @@ async def get_notifications_for_employee(
 async def mark_notifications_as_read(
     payload: NotificationReadRequest,
     user_data: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     payload: {
-      "employee_id": UUID,
       "notification_ids": [UUID, UUID, ...]
     }
-    Отмечаем все записи NotificationsEmployees.is_shown = True
-    для заданного employee_id и списка notification_ids.
+    Одним UPDATE отмечаем NotificationsEmployees.is_shown = True
+    для текущего сотрудника и списка notification_ids; updated — сколько было непрочитанных.
     """
-    exists_emp = db.query(Employers).filter(Employers.id_employee == user_data["employee"].id_employee).first()
-    if not exists_emp:
-        raise HTTPException(status_code=404, detail="Employee not found")
-
-    assocs = (
-        db.query(NotificationsEmployees)
-          .filter(
-              NotificationsEmployees.id_employee == user_data["employee"].id_employee,
-              NotificationsEmployees.id_notification.in_(payload.notification_ids)
-          )
-          .all()
-    )
-
-    if not assocs:
+    if not payload.notification_ids:
         return {"updated": 0}
+    updated = await mark_read(db, user_data["employee"].id_employee, payload.notification_ids)
+    return {"updated": updated}
 
-    for assoc in assocs:
-        assoc.is_shown = True
 
-    db.commit()
-    return {"updated": len(assocs)}
+@router.post(
+    "/notifications/read-all",
+    summary="Отметить все уведомления сотрудника как прочитанные"
+)
+async def mark_all_notifications_as_read(
+    user_data: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    updated = await mark_read(db, user_data["employee"].id_employee)
+    return {"updated": updated}
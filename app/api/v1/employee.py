@@ -1,7 +1,11 @@
+import csv
 import traceback
-from typing import Dict, List, Optional
+from typing import Dict, List, Literal, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from uuid import UUID
 
@@ -10,10 +14,16 @@ from app.models.models import Employers, InterestsEmployers, TechnologyEmployee,
 from app.schemas.schemas import EmployeeCreate, EmployeeRead, EmployeeUpdate, MessageDTO, EmployeeListWithMeta, \
     EmployeeInterestsUpdate, EmployeeTechnologiesUpdate, EmployeeProjectsUpdate, NewTechnologyInput, \
     ExistingTechnologyInput, NewInterestInput, ExistingInterestInput, HrEmployeeUpdate, EmployeeCreateHr, \
-    EmployeePositionDepartmentUpdate
-from app.db.get_db import get_db
+    EmployeePositionDepartmentUpdate, EmployeeImportResult
+from app.core.config import settings
+from app.db.get_db import get_db, get_async_db, get_async_read_db
+from app.services.city_service import apply_city_changes
+from app.services.export_service import stream_directory
+from app.services.import_service import detect_format, import_employees
+from app.services.recommendation_service import shift_group_membership
+from app.services.reference_cache import reference_cache
 from app.services.user_service import check_unique_fields, get_current_user, update_entity, get_employee_with_id, \
-    get_employees_list
+    get_employees_list, delete_employees, has_system_role_sync
 
 router = APIRouter(prefix='/employee', tags=['Employee'])
 
@@ -21,7 +31,7 @@ router = APIRouter(prefix='/employee', tags=['Employee'])
 @router.post("", response_model=EmployeeRead)
 async def create_employee(
         employee_in: EmployeeCreate,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     db_employee = Employers(
         telegram_name=employee_in.telegram_name,
@@ -29,8 +39,8 @@ async def create_employee(
         full_name=employee_in.full_name
     )
     db.add(db_employee)
-    db.commit()
-    db.refresh(db_employee)
+    await db.commit()
+    await db.refresh(db_employee)
     return db_employee
 
 
@@ -54,7 +64,7 @@ async def list_employees(
         id_project: Optional[List[str]] = Query(None),
         skip: int = Query(0, ge=0),
         limit: int = Query(10, ge=1),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_read_db)
 ):
     filters = {
         "first_name": first_name,
@@ -70,7 +80,7 @@ async def list_employees(
         "id_technology": id_technology,
         "id_project": id_project,
     }
-    res = get_employees_list(
+    res = await get_employees_list(
         db,
         str_to_find=str_to_find,
         filters=filters,
@@ -88,12 +98,25 @@ async def list_employees(
     }
 
 
+@router.get("/hr/export")
+def export_employees_hr(
+        file_format: Literal["csv", "ndjson"] = Query("csv", alias="format"),
+        user_data: Dict = Depends(get_current_user)
+):
+    media_type = "text/csv; charset=utf-8" if file_format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        stream_directory(file_format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="employees.{file_format}"'}
+    )
+
+
 @router.get("/{employee_id}", response_model=EmployeeRead)
 async def get_employee(
         employee_id: UUID,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_read_db)
 ):
-    employee = get_employee_with_id(db, str(employee_id))
+    employee = await get_employee_with_id(db, employee_id)
 
     if not employee:
         raise HTTPException(status_code=404, detail="Employee not found")
@@ -104,7 +127,7 @@ async def get_employee(
 async def edit_employee(
         employee_update: EmployeeUpdate,
         user_data: Dict = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     try:
         duplicated_fields = await check_unique_fields(
@@ -118,9 +141,14 @@ async def edit_employee(
         if duplicated_fields:
             raise HTTPException(status_code=400, detail=f"{str(duplicated_fields)} already in use")
 
+        employee = await db.get(Employers, user_data['employee'].id_employee)
+        if not employee:
+            raise HTTPException(status_code=404, detail="Employee not found")
+
+        await db.run_sync(apply_city_changes, removed=[employee.city], added=[employee_update.city])
         updated_employee = await update_entity(
             db=db,
-            entity=user_data['employee'],
+            entity=employee,
             entity_updated_data=employee_update.dict()
         )
 
@@ -137,7 +165,7 @@ async def edit_employee_hr(
         employee_update: HrEmployeeUpdate,
         employee_id: UUID,
         user_data: Dict = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     try:
         duplicated_fields = await check_unique_fields(
@@ -151,9 +179,18 @@ async def edit_employee_hr(
         if duplicated_fields:
             raise HTTPException(status_code=400, detail=f"{str(duplicated_fields)} already in use")
 
+        employee = await db.get(Employers, employee_id)
+        if not employee:
+            raise HTTPException(status_code=404, detail="Employee not found")
+
+        await db.run_sync(apply_city_changes, removed=[employee.city], added=[employee_update.city])
+        if employee.id_department != employee_update.id_department:
+            if employee.id_department is not None:
+                await db.execute(shift_group_membership([(employee_id, "department", employee.id_department)], -1))
+            await db.execute(shift_group_membership([(employee_id, "department", employee_update.id_department)], 1))
         updated_employee = await update_entity(
             db=db,
-            entity=db.query(Employers).filter(Employers.id_employee == employee_id).first(),
+            entity=employee,
             entity_updated_data=employee_update.dict()
         )
 
@@ -169,28 +206,21 @@ async def edit_employee_hr(
 async def delete_employee_hr(
     employee_id: UUID,
     user_data: Dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
-        employee = db.query(Employers).filter_by(id_employee=str(employee_id)).first()
+        employee = await db.get(Employers, employee_id)
         if not employee:
             raise HTTPException(status_code=404, detail="Employee not found")
 
-        db.query(InterestsEmployers).filter_by(id_employee=str(employee_id)).delete()
-        db.query(TechnologyEmployee).filter_by(id_employee=str(employee_id)).delete()
-        db.query(ProjectsEmployers).filter_by(id_employee=str(employee_id)).delete()
-        db.query(EventEmployers).filter_by(id_employee=str(employee_id)).delete()
-        db.query(NotificationsEmployees).filter_by(id_employee=str(employee_id)).delete()
-        db.query(Users).filter_by(employee_id=str(employee_id)).delete()
-
-        db.delete(employee)
-        db.commit()
+        await db.run_sync(delete_employees, [employee_id])
+        await db.commit()
 
         return MessageDTO(message=f"Employee {employee_id} deleted successfully")
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         traceback.print_exc()
         raise HTTPException(status_code=500, detail="Error deleting employee")
 
@@ -199,7 +229,7 @@ async def delete_employee_hr(
 async def create_employee_hr(
     employee_in: EmployeeCreateHr,
     user_data: Dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
         # Проверяем уникальность полей
@@ -225,58 +255,112 @@ async def create_employee_hr(
             city=employee_in.city
         )
         db.add(db_employee)
-        db.commit()
-        db.refresh(db_employee)
+        await db.run_sync(apply_city_changes, added=[employee_in.city])
+        await db.commit()
+        await db.refresh(db_employee)
 
         return db_employee
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         traceback.print_exc()
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+@router.post("/hr/import", response_model=EmployeeImportResult)
+def import_employees_hr(
+    file: UploadFile = File(..., description="CSV с заголовком или NDJSON, по сотруднику на строку"),
+    mode: Literal["insert", "reconcile"] = Query("insert", description="insert — только создание, reconcile — создание и обновление"),
+    delete_missing: bool = Query(False, description="В режиме reconcile удалить сотрудников, которых нет в файле"),
+    file_format: Optional[Literal["csv", "ndjson"]] = Query(None, alias="format"),
+    user_data: Dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # reconcile с delete_missing удаляет всех, кого нет в файле, — только для HR и администраторов
+    if not has_system_role_sync(
+        db,
+        user_data['employee'].role_id,
+        [name.strip() for name in settings.EMPLOYEE_IMPORT_ROLE_NAMES.split(",") if name.strip()]
+    ):
+        raise HTTPException(status_code=403, detail="Нет прав на импорт сотрудников")
+
+    fmt = file_format or detect_format(file.filename, file.content_type)
+    try:
+        return import_employees(
+            db,
+            file.file,
+            fmt,
+            reconcile=mode == "reconcile",
+            delete_missing=delete_missing,
+            protected_ids=[user_data['employee'].id_employee]
+        )
+    except UnicodeDecodeError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Файл должен быть в кодировке UTF-8")
+    except csv.Error as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Некорректный CSV: {e}")
+    except Exception:
+        db.rollback()
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail="Ошибка при импорте сотрудников")
+
+
 @router.put("/me/interests", response_model=MessageDTO)
 async def update_employee_interests(
     update_data: EmployeeInterestsUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user_data: Dict = Depends(get_current_user)
 ):
     try:
         employee_id = user_data['employee'].id_employee
 
+        old_interest_ids = set((await db.scalars(
+            select(InterestsEmployers.id_interest).where(InterestsEmployers.id_employee == employee_id)
+        )).all())
+        new_interest_ids = set()
+
         # Удаляем старые связи
-        db.query(InterestsEmployers).filter_by(id_employee=employee_id).delete()
+        await db.execute(delete(InterestsEmployers).where(InterestsEmployers.id_employee == employee_id))
 
         for interest in update_data.interests:
             if isinstance(interest, ExistingInterestInput):
                 # Проверим, что интерес с таким id существует
-                exists = db.query(Interests).filter_by(id_interest=interest.id).first()
+                exists = await reference_cache.alookup(db, "interests", interest.id)
                 if not exists:
                     raise HTTPException(status_code=400, detail=f"Интереса с ID {interest.id} не существует")
                 db.add(InterestsEmployers(id_employee=employee_id, id_interest=interest.id))
+                new_interest_ids.add(interest.id)
 
             elif isinstance(interest, NewInterestInput):
                 # Ищем по имени — если есть, берем; если нет — создаем
-                existing = db.query(Interests).filter_by(name_interest=interest.name_interest).first()
+                existing = await db.scalar(select(Interests).where(Interests.name_interest == interest.name_interest))
                 if not existing:
                     new_interest = Interests(name_interest=interest.name_interest)
                     db.add(new_interest)
-                    db.flush()  # получим id
+                    await db.flush()  # получим id
                     interest_id = new_interest.id_interest
                 else:
                     interest_id = existing.id_interest
 
                 db.add(InterestsEmployers(id_employee=employee_id, id_interest=interest_id))
+                new_interest_ids.add(interest_id)
 
-        db.commit()
+        # счётчики рекомендаций: выход из снятых интересов и вход в новые
+        for interest_ids, sign in ((old_interest_ids - new_interest_ids, -1), (new_interest_ids - old_interest_ids, 1)):
+            if interest_ids:
+                await db.execute(shift_group_membership(
+                    [(employee_id, "interest", interest_id) for interest_id in interest_ids], sign
+                ))
+
+        await db.commit()
         return MessageDTO(message=f"Интересы сотрудника {employee_id} обновлены")
 
     except HTTPException:
         raise
     except Exception:
-        db.rollback()
+        await db.rollback()
         traceback.print_exc()
         raise HTTPException(status_code=500, detail="Ошибка при обновлении интересов")
 
@@ -284,7 +368,7 @@ async def update_employee_interests(
 @router.put("/me/technologies", response_model=MessageDTO)
 async def update_my_technologies(
     update_data: EmployeeTechnologiesUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user_data: Dict = Depends(get_current_user)
 ):
     employee_id = user_data['employee'].id_employee
@@ -317,12 +401,12 @@ async def update_my_technologies(
                 new_names.add(clean_name)
 
         # Удаляем старые связи
-        db.query(TechnologyEmployee).filter_by(id_employee=employee_id).delete()
+        await db.execute(delete(TechnologyEmployee).where(TechnologyEmployee.id_employee == employee_id))
 
         for tech in update_data.technologies:
             if isinstance(tech, ExistingTechnologyInput):
                 # Проверим, что технология с таким ID существует
-                exists = db.query(Technologies).filter_by(id_technology=tech.id_technology).first()
+                exists = await reference_cache.alookup(db, "technologies", tech.id_technology)
                 if not exists:
                     raise HTTPException(status_code=400, detail=f"Технологии с ID {tech.id_technology} не существует")
 
@@ -337,7 +421,7 @@ async def update_my_technologies(
                 desc_clean = tech.description.strip()
 
                 # Проверим, существует ли технология с таким именем
-                existing = db.query(Technologies).filter_by(name_technology=name_clean).first()
+                existing = await db.scalar(select(Technologies).where(Technologies.name_technology == name_clean))
                 if existing:
                     tech_id = existing.id_technology
                 else:
@@ -346,7 +430,7 @@ async def update_my_technologies(
                         description=desc_clean
                     )
                     db.add(new_tech)
-                    db.flush()  # получим id_technology
+                    await db.flush()  # получим id_technology
                     tech_id = new_tech.id_technology
 
                 db.add(TechnologyEmployee(
@@ -355,13 +439,13 @@ async def update_my_technologies(
                     id_rank=tech.id_rank
                 ))
 
-        db.commit()
+        await db.commit()
         return MessageDTO(message=f"Технологии сотрудника {employee_id} обновлены")
 
     except HTTPException:
         raise
     except Exception:
-        db.rollback()
+        await db.rollback()
         traceback.print_exc()
         raise HTTPException(status_code=500, detail="Ошибка при обновлении технологий")
 
@@ -1,9 +1,13 @@
-from typing import Optional
+from datetime import date
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from uuid import UUID
 
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
 
 from app.services.event_service import (
     create_event,
@@ -13,19 +17,32 @@ from app.services.event_service import (
     join_event,
     leave_event,
     update_event,
-    delete_event, list_my_events,
+    delete_event, list_my_events, list_calendar, list_attendees, build_event_reads, attach_attendees_statement,
+)
+from app.services.recommendation_service import recommend_events
+from app.services.calendar_service import (
+    calendar_token,
+    check_calendar_token,
+    issue_calendar_secret,
+    agenda_window_start,
+    agenda_etag,
+    stream_agenda_ical,
 )
 from app.schemas.schemas import (
     EventCreate,
     EventUpdate,
     EventRead,
-    PaginatedEvents, EventTypeRead, EmployeeSummary,
+    PaginatedEvents, EventTypeRead, EmployeeSummary, CalendarEvents, CalendarLink, AttendeePage,
+    RecommendedEvent,
 )
-from app.db.get_db import get_db
+from app.core.config import settings
+from app.db.get_db import get_async_db, get_async_read_db
 
-from app.models.models import Employers, EventEmployers, Events, EventTypes
+from app.models.models import Employers, Events, EventTypes
 from app.schemas.schemas import MessageDTO
-from app.services.user_service import get_current_user, create_notification
+from app.services.reference_cache import reference_cache
+from app.services.notification_service import enqueue_notification
+from app.services.user_service import get_current_user
 
 router = APIRouter(prefix="/events", tags=["Events"])
 
@@ -33,48 +50,51 @@ router = APIRouter(prefix="/events", tags=["Events"])
 @router.post("", response_model=EventRead)
 async def create_new_event(
     event_in: EventCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user_data: dict = Depends(get_current_user),
 ):
     owner_id = user_data["employee"].id_employee
-    new_event = create_event(db, owner_id, event_in)
-    db.commit()
-    db.flush()
-
-    unique_attendees = set(event_in.attendee_ids or [])
-    for attendee_id in unique_attendees:
-        emp_obj = db.query(Employers).filter_by(id_employee=attendee_id).first()
-        if not emp_obj:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Сотрудник с ID {attendee_id} не найден"
-            )
 
-        db.add(EventEmployers(id_event=new_event.id_event, id_employee=attendee_id))
-        db.commit()
-
-        create_notification(db, f"Вы добавлены на мероприятие: {new_event.name_event}", [attendee_id])
-
-    event_type_obj = db.query(EventTypes).filter_by(id_event_type=new_event.id_event_type).first()
-    if not event_type_obj:
+    event_type = await reference_cache.alookup(db, "event_types", event_in.id_event_type)
+    if not event_type:
         raise HTTPException(status_code=404, detail="Тип события не найден")
-    event_type_summary = EventTypeRead.from_orm(event_type_obj)
+    event_type_summary = EventTypeRead(**event_type)
 
-    owner_obj = db.query(Employers).filter_by(id_employee=new_event.id_owner).first()
+    owner_obj = await db.get(Employers, owner_id)
     if not owner_obj:
         raise HTTPException(status_code=404, detail="Организатор не найден")
     owner_summary = EmployeeSummary.from_orm(owner_obj)
 
-    attendees = (
-        db.query(Employers)
-            .join(EventEmployers, EventEmployers.id_employee == Employers.id_employee)
-            .filter(EventEmployers.id_event == new_event.id_event)
-            .all()
-    )
+    # все участники проверяются одним IN-запросом
+    unique_attendees = list(dict.fromkeys(event_in.attendee_ids or []))
+    attendees = []
+    if unique_attendees:
+        attendees = (await db.scalars(
+            select(Employers).where(Employers.id_employee.in_(unique_attendees))
+        )).all()
+        found_ids = {emp.id_employee for emp in attendees}
+        missing = [attendee_id for attendee_id in unique_attendees if attendee_id not in found_ids]
+        if missing:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Сотрудник с ID {missing[0]} не найден"
+            )
 
+    # мероприятие, участники и одно уведомление на всех — в одной транзакции
+    new_event = await create_event(db, owner_id, event_in)
+    if unique_attendees:
+        # тот же запрос, что и при join: attendee_count и счётчики для рекомендаций обновляются вместе со вставкой
+        added = (await db.execute(attach_attendees_statement(new_event.id_event, unique_attendees))).first()
+        # счётчик обновлён Core-запросом в обход сессии; значение из RETURNING, без лишнего UPDATE при commit
+        set_committed_value(new_event, "attendee_count", added.changed if added else 0)
+        await enqueue_notification(db, f"Вы добавлены на мероприятие: {new_event.name_event}", unique_attendees)
+    await db.commit()
+
+    # в ответе — только первые EVENT_ATTENDEES_PREVIEW, как и в GET /events/{event_id}
+    preview = sorted(attendees, key=lambda emp: emp.id_employee)
     return EventRead.from_orm(
         new_event,
-        attendees=attendees,
+        attendees=[EmployeeSummary.from_orm(emp) for emp in preview[:settings.EVENT_ATTENDEES_PREVIEW]],
         owner_summary=owner_summary,
         event_type_summary=event_type_summary
     )
@@ -85,9 +105,9 @@ async def get_all_events(
     skip: int = Query(0, ge=0),
     limit: int = Query(10, ge=1),
     search: Optional[str] = Query(None, description="Фильтр по названию, месту или типу"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
 ):
-    return list_events(db, skip=skip, limit=limit, search=search)
+    return await list_events(db, skip=skip, limit=limit, search=search)
 
 
 @router.get("/my", response_model=PaginatedEvents)
@@ -95,42 +115,156 @@ async def get_my_events(
     skip: int = Query(0, ge=0),
     limit: int = Query(10, ge=1),
     search: Optional[str] = Query(None, description="Фильтр по названию, месту или типу"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
     user_data: dict = Depends(get_current_user),
 ):
     employee_id = user_data["employee"].id_employee
-    return list_my_events(db, employee_id, search=search, skip=skip, limit=limit)
+    return await list_my_events(db, employee_id, search=search, skip=skip, limit=limit)
+
+
+@router.get("/calendar", response_model=CalendarEvents)
+async def get_calendar(
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    upcoming: bool = Query(False, description="Только мероприятия начиная с сегодняшнего дня"),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="next_cursor из предыдущей страницы"),
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    if upcoming:
+        date_from = max(date_from or date.today(), date.today())
+    return await list_calendar(db, date_from, date_to, limit, cursor)
+
+
+@router.get("/my/agenda", response_model=CalendarEvents)
+async def get_my_agenda(
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    upcoming: bool = Query(True, description="Только мероприятия начиная с сегодняшнего дня"),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="next_cursor из предыдущей страницы"),
+    db: AsyncSession = Depends(get_async_read_db),
+    user_data: dict = Depends(get_current_user),
+):
+    if upcoming:
+        date_from = max(date_from or date.today(), date.today())
+    return await list_calendar(
+        db, date_from, date_to, limit, cursor, employee_id=user_data["employee"].id_employee
+    )
+
+
+@router.get("/recommended", response_model=List[RecommendedEvent])
+async def get_recommended_events(
+    limit: int = Query(10, ge=1, le=50),
+    db: AsyncSession = Depends(get_async_read_db),
+    user_data: dict = Depends(get_current_user),
+):
+    """
+    Предстоящие мероприятия, куда идут коллеги по проектам, отделу и общим интересам.
+    score — взвешенное число таких коллег среди участников.
+    """
+    ranked = await recommend_events(db, user_data["employee"].id_employee, limit)
+    if not ranked:
+        return []
+    events = {
+        ev.id_event: ev
+        for ev in (await db.scalars(select(Events).where(Events.id_event.in_([event_id for event_id, _ in ranked])))).all()
+    }
+    ordered = [(events[event_id], score) for event_id, score in ranked if event_id in events]
+    reads = await build_event_reads(db, [ev for ev, _ in ordered])
+    return [RecommendedEvent(event=read, score=score) for read, (_, score) in zip(reads, ordered)]
+
+
+def _calendar_link(request: Request, employee_id: UUID, secret: str) -> CalendarLink:
+    url = request.url_for("get_agenda_ical", employee_id=employee_id)
+    return CalendarLink(url=str(url.include_query_params(token=calendar_token(employee_id, secret))))
+
+
+@router.get("/my/calendar-link", response_model=CalendarLink)
+async def get_my_calendar_link(
+    request: Request,
+    user_data: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Ссылка для подписки календаря (Google, Outlook, Apple) на мероприятия сотрудника."""
+    employee_id = user_data["employee"].id_employee
+    return _calendar_link(request, employee_id, await issue_calendar_secret(db, employee_id))
+
+
+@router.post("/my/calendar-link/rotate", response_model=CalendarLink)
+async def rotate_my_calendar_link(
+    request: Request,
+    user_data: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Новая ссылка на календарь; прежняя перестаёт работать."""
+    employee_id = user_data["employee"].id_employee
+    return _calendar_link(request, employee_id, await issue_calendar_secret(db, employee_id, rotate=True))
+
+
+@router.get("/calendar/{employee_id}.ics", name="get_agenda_ical")
+async def get_agenda_ical(
+    employee_id: UUID,
+    request: Request,
+    token: str = Query(...),
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    """
+    iCal-лента мероприятий сотрудника (за EVENTS_ICAL_PAST_DAYS дней назад и все будущие).
+    При совпадении If-None-Match отвечает 304 без чтения мероприятий.
+    """
+    await check_calendar_token(db, employee_id, token)
+    date_from = agenda_window_start()
+    etag = await agenda_etag(db, employee_id, date_from)
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=300"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return StreamingResponse(
+        stream_agenda_ical(employee_id, date_from),
+        media_type="text/calendar; charset=utf-8",
+        headers={**headers, "Content-Disposition": 'inline; filename="events.ics"'}
+    )
 
 
 @router.delete("/{event_id}/leave", response_model=MessageDTO)
 async def leave_myself(
     event_id: UUID,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user_data: dict = Depends(get_current_user),
 ):
-    leave_event(db, event_id, user_data["employee"].id_employee)
-    db.commit()
+    await leave_event(db, event_id, user_data["employee"].id_employee)
+    await db.commit()
     return MessageDTO(message="Вы отказались от участия в мероприятии")
 
 
+@router.get("/{event_id}/attendees", response_model=AttendeePage)
+async def get_event_attendees(
+    event_id: UUID,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="next_cursor из предыдущей страницы"),
+    search: Optional[str] = Query(None, description="Фильтр по имени или фамилии"),
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    return await list_attendees(db, event_id, limit, cursor=cursor, search=search)
+
+
 @router.post("/{event_id}/attendees", response_model=MessageDTO)
 async def add_person_to_event(
     event_id: UUID,
     employee_id: UUID = Query(..., description="ID сотрудника, которого добавляем"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user_data: dict = Depends(get_current_user),
 ):
-    event = db.query(Events).filter_by(id_event=event_id).first()
+    event = await db.get(Events, event_id)
     if not event:
         raise HTTPException(status_code=404, detail="Мероприятие не найдено")
 
     if event.id_owner != user_data["employee"].id_employee:
         raise HTTPException(status_code=403, detail="Нет прав добавлять сотрудников")
 
-    add_attendee(db, event_id, employee_id)
-    db.commit()
-
-    create_notification(db, f"Вы добавлены на мероприятие: {event.name_event}", [employee_id])
+    await add_attendee(db, event_id, employee_id)
+    await enqueue_notification(db, f"Вы добавлены на мероприятие: {event.name_event}", [employee_id])
+    await db.commit()
 
     return MessageDTO(message="Сотрудник успешно добавлен в мероприятие")
 
@@ -138,11 +272,11 @@ async def add_person_to_event(
 @router.post("/{event_id}/join", response_model=MessageDTO)
 async def join_myself(
     event_id: UUID,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user_data: dict = Depends(get_current_user),
 ):
-    join_event(db, event_id, user_data["employee"].id_employee)
-    db.commit()
+    await join_event(db, event_id, user_data["employee"].id_employee)
+    await db.commit()
 
     return MessageDTO(message="Вы успешно присоединились к мероприятию")
 
@@ -151,50 +285,28 @@ async def join_myself(
 async def edit_my_event(
     event_id: UUID,
     event_in: EventUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user_data: dict = Depends(get_current_user),
 ):
-    updated = update_event(db, event_id, event_in, user_data["employee"].id_employee)
-    db.commit()
-    attendees = (
-        db.query(Employers)
-        .join(EventEmployers, EventEmployers.id_employee == Employers.id_employee)
-        .filter(EventEmployers.id_event == event_id)
-        .all()
-    )
-
-    event_type_obj = db.query(EventTypes).filter_by(id_event_type=updated.id_event_type).first()
-    if not event_type_obj:
-        raise HTTPException(status_code=404, detail="Тип события не найден")
-    event_type_summary = EventTypeRead.from_orm(event_type_obj)
-
-    owner_obj = db.query(Employers).filter_by(id_employee=updated.id_owner).first()
-    if not owner_obj:
-        raise HTTPException(status_code=404, detail="Организатор не найден")
-    owner_summary = EmployeeSummary.from_orm(owner_obj)
-
-    return EventRead.from_orm(
-        updated,
-        attendees=attendees,
-        owner_summary=owner_summary,
-        event_type_summary=event_type_summary
-    )
+    updated = await update_event(db, event_id, event_in, user_data["employee"].id_employee)
+    await db.commit()
+    return (await build_event_reads(db, [updated]))[0]
 
 
 @router.delete("/{event_id}", response_model=MessageDTO)
 async def delete_my_event(
     event_id: UUID,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user_data: dict = Depends(get_current_user),
 ):
-    delete_event(db, event_id, user_data["employee"].id_employee)
-    db.commit()
+    await delete_event(db, event_id, user_data["employee"].id_employee)
+    await db.commit()
     return MessageDTO(message="Мероприятие успешно удалено")
 
 
 @router.get("/{event_id}", response_model=EventRead)
 async def get_one_event(
     event_id: UUID,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
 ):
-    return get_event(db, event_id)
+    return await get_event(db, event_id)
@@ -1,14 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from app.db.get_db import get_db
+from app.db.get_db import get_read_db
 from app.models.models import *
 from app.schemas.schemas import GraphViewDTO, GraphNode, GraphLink
 
 router = APIRouter(prefix="/graph", tags=["graph"])
 
+GRAPH_TYPES = ("departments", "roles", "cities", "teams", "stacks", "interests")
+
 
 @router.get("/{graph_type}", response_model=GraphViewDTO)
-def get_structure(graph_type: str, db: Session = Depends(get_db)):
+def get_structure(graph_type: str, db: Session = Depends(get_read_db)):
     nodes = []
     links = []
 
@@ -42,19 +44,20 @@ def get_structure(graph_type: str, db: Session = Depends(get_db)):
             links.append(GraphLink(source=str(a.id_role), target=str(emp.id_employee)))
 
     elif graph_type == "cities":
+        cities = db.query(Cities).filter(Cities.headcount > 0).all()
+        city_ids = {c.name_city: str(c.id_city) for c in cities}
         employees = db.query(Employers).all()
-        cities = set(e.city for e in employees)
 
-        for city in cities:
-            city_id = city.replace(" ", "_")
-            nodes.append(GraphNode(id=city_id, name=city, group="city"))
+        for c in cities:
+            nodes.append(GraphNode(id=city_ids[c.name_city], name=c.name_city, group="city"))
 
         for e in employees:
             eid = str(e.id_employee)
             full_name = f"{e.last_name} {e.first_name}"
-            city_id = e.city.replace(" ", "_")
             nodes.append(GraphNode(id=eid, name=full_name, group="employee"))
-            links.append(GraphLink(source=city_id, target=eid))
+            city_id = city_ids.get(e.city)
+            if city_id:
+                links.append(GraphLink(source=city_id, target=eid))
 
     elif graph_type == "teams":
         projects = db.query(Projects).all()
@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.get_db import get_async_db
+from app.services.warmup import warmup_state
+
+router = APIRouter(prefix='/health', tags=['Health'])
+
+
+@router.get("/live")
+async def liveness():
+    return {"status": "ok"}
+
+
+@router.get("/ready")
+async def readiness(db: AsyncSession = Depends(get_async_db)):
+    state = warmup_state.snapshot()
+    if not warmup_state.ready:
+        return JSONResponse(status_code=503, content={"status": "warming_up", **state})
+    try:
+        await db.execute(text("SELECT 1"))
+    except Exception as exc:
+        return JSONResponse(status_code=503, content={"status": "database_unavailable", **state,
+                                                      "error": exc.__class__.__name__})
+    return {"status": "ready", **state}
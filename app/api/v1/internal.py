@@ -0,0 +1,37 @@
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+
+from app.core.config import settings
+from app.core.database import engine, async_engine, replica_engine, async_replica_engine
+from app.core.pool import pool_stats
+from app.services.password_hasher import password_hasher
+
+
+def require_internal_token(x_internal_token: Optional[str] = Header(None)):
+    # без настроенного токена служебные эндпоинты закрыты, а не публичны
+    if not settings.INTERNAL_API_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_internal_token or not hmac.compare_digest(x_internal_token, settings.INTERNAL_API_TOKEN):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+router = APIRouter(prefix='/internal', tags=['Internal'], dependencies=[Depends(require_internal_token)])
+
+
+@router.get("/password-hashing")
+def password_hashing_stats():
+    return password_hasher.stats()
+
+
+@router.get("/db-pool")
+def db_pool_stats():
+    stats = {
+        "sync": pool_stats(engine),
+        "async": pool_stats(async_engine.sync_engine),
+    }
+    if replica_engine is not engine:
+        stats["replica_sync"] = pool_stats(replica_engine)
+        stats["replica_async"] = pool_stats(async_replica_engine.sync_engine)
+    return stats
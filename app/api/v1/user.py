@@ -1,49 +1,49 @@
 import traceback
 from typing import Dict
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.config import settings
-from app.db.get_db import get_db
+from app.db.get_db import get_async_db
 from app.models.models import Users
 from app.schemas.schemas import UserResponse, Token, LoginDTO, TokenNRoleIdDto
 from app.services.user_service import (
-    token_blacklist,
-    failed_attempts_cache,
-    verify_password,
-    create_access_token,
+    create_user_access_token,
     get_current_user, get_user_with_related
 )
+from app.services.login_throttle import client_ip, login_throttler
+from app.services.password_hasher import password_hasher
+from app.services.principal_cache import principal_cache
+from app.services.revocation_store import revocation_store
 
 router = APIRouter(prefix='/user', tags=['User'])
 
 
 @router.post("/login", response_model=TokenNRoleIdDto)
-def login(data: LoginDTO, db: Session = Depends(get_db)):
-    user = db.query(Users).filter(Users.username == data.username).first()
+async def login(data: LoginDTO, request: Request, db: AsyncSession = Depends(get_async_db)):
+    ip = client_ip(request)
+    # баны и лимиты проверяем до запроса в Users и bcrypt
+    await db.run_sync(login_throttler.check, data.username, ip)
+
+    user = await db.scalar(select(Users).where(Users.username == data.username))
     if not user:
+        await db.run_sync(login_throttler.record_failure, None, ip)
         raise HTTPException(status_code=400, detail="Incorrect username or password")
 
-    cache = failed_attempts_cache.get(data.username, {"attempts": 0, "banned_until": None})
-    banned_until = cache.get("banned_until")
-    if banned_until and datetime.utcnow() < banned_until:
-        raise HTTPException(status_code=403, detail="User is banned. Try again later.")
-
-    if not verify_password(data.password, user.hashed_password):
-        attempts = cache.get("attempts", 0) + 1
-        banned_until = None
-        if attempts >= settings.MAX_FAILED_ATTEMPTS:
-            banned_until = datetime.utcnow() + timedelta(minutes=settings.BAN_DURATION_MINUTES)
-            attempts = 0
-        failed_attempts_cache[data.username] = {"attempts": attempts, "banned_until": banned_until}
+    # bcrypt — в отдельном пуле, при переполнении очереди сразу 503
+    valid, new_hash = await password_hasher.verify_and_update(data.password, user.hashed_password)
+    if not valid:
+        await db.run_sync(login_throttler.record_failure, data.username, ip)
         raise HTTPException(status_code=400, detail="Incorrect username or password")
 
-    if data.username in failed_attempts_cache:
-        del failed_attempts_cache[data.username]
+    if new_hash:
+        # стоимость BCRYPT_ROUNDS изменилась — прозрачно перехэшируем пароль
+        user.hashed_password = new_hash
+        await db.commit()
+
+    await db.run_sync(login_throttler.reset, data.username)
 
-    token_data = {"sub": user.username}
-    access_token = create_access_token(data=token_data)
+    access_token = create_user_access_token(user)
     return TokenNRoleIdDto(
         token=Token(access_token=access_token),
         role_id=user.role_id
@@ -51,19 +51,20 @@ def login(data: LoginDTO, db: Session = Depends(get_db)):
 
 
 @router.post("/logout")
-def logout(user_data: Dict = Depends(get_current_user)):
-    token_blacklist.add(user_data['token'])
+async def logout(user_data: Dict = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    await db.run_sync(revocation_store.revoke, user_data['token_id'], user_data['token_expires_at'])
+    principal_cache.invalidate(user_data['user'].username)
     return {"msg": "Successfully logged out"}
 
 
 @router.get("/me", response_model=UserResponse)
-def get_me(
+async def get_me(
     user_data: Dict = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     try:
         username = user_data["user"].username
-        user = get_user_with_related(db, username)
+        user = await get_user_with_related(db, username)
 
         if not user:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
@@ -13,6 +13,73 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int
     MAX_FAILED_ATTEMPTS: int
     BAN_DURATION_MINUTES: int
+    IMPORT_CHUNK_SIZE: int = 1000
+    EXPORT_BATCH_SIZE: int = 1000
+    REFERENCE_CACHE_TTL_SECONDS: int = 300
+    PRINCIPAL_CACHE_SIZE: int = 10000
+    PRINCIPAL_CACHE_TTL_SECONDS: int = 60
+    PRINCIPAL_FROM_TOKEN_CLAIMS: bool = False
+    REVOCATION_BACKEND: str = "database"
+    REVOCATION_SYNC_SECONDS: int = 5
+    REVOCATION_REBUILD_SECONDS: int = 3600
+    REVOCATION_BLOOM_CAPACITY: int = 100000
+    REVOCATION_BLOOM_ERROR_RATE: float = 0.001
+    LOGIN_THROTTLE_BACKEND: str = "memory"
+    LOGIN_THROTTLE_MAX_KEYS: int = 100000
+    LOGIN_WINDOW_SECONDS: int = 900
+    LOGIN_IP_MAX_FAILURES: int = 50
+    TRUST_FORWARDED_FOR: bool = False
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_PENDING: int = 32
+    # заголовок X-Internal-Token для /internal/*; пустое значение — эндпоинты отвечают 404
+    INTERNAL_API_TOKEN: str = ""
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_TIMEOUT_MS: int = 0
+    REPLICA_DATABASE_URL: str = ""
+    READ_YOUR_WRITES_SECONDS: int = 5
+    WEB_RELOAD: bool = False
+    WEB_WORKERS: int = 0
+    WEB_PRELOAD: bool = True
+    WEB_MAX_REQUESTS: int = 10000
+    WEB_MAX_REQUESTS_JITTER: int = 1000
+    WEB_TIMEOUT: int = 60
+    WEB_GRACEFUL_TIMEOUT: int = 30
+    WEB_KEEPALIVE: int = 5
+    NOTIFICATION_OUTBOX_WORKER: bool = True
+    NOTIFICATION_OUTBOX_BATCH_SIZE: int = 100
+    NOTIFICATION_OUTBOX_POLL_SECONDS: float = 1.0
+    NOTIFICATION_OUTBOX_MAX_ATTEMPTS: int = 5
+    NOTIFICATION_PUSH_ENABLED: bool = True
+    NOTIFICATION_PUSH_CHANNEL: str = "notifications"
+    NOTIFICATION_STREAM_KEEPALIVE_SECONDS: int = 15
+    NOTIFICATION_STREAM_QUEUE_SIZE: int = 100
+    # срок подписанного токена для ?token= у /common/notifications/stream (EventSource без заголовков)
+    NOTIFICATION_STREAM_TOKEN_SECONDS: int = 60
+    EVENT_ATTENDEES_PREVIEW: int = 10
+    EVENTS_ICAL_PAST_DAYS: int = 30
+    RECOMMENDATION_WEIGHT_PROJECT: int = 3
+    RECOMMENDATION_WEIGHT_INTEREST: int = 2
+    RECOMMENDATION_WEIGHT_DEPARTMENT: int = 1
+    EVENTS_ICAL_BATCH_SIZE: int = 500
+    # системные роли (через запятую), которым разрешены рассылки на любую аудиторию
+    BROADCAST_ROLE_NAMES: str = "Администратор,HR"
+    # системные роли (через запятую), которым разрешён массовый импорт сотрудников
+    EMPLOYEE_IMPORT_ROLE_NAMES: str = "Администратор,HR"
+    # фоновая очистка старых уведомлений по срокам ниже; включается явно (NOTIFICATION_RETENTION_ENABLED=true),
+    # т.к. при первом запуске удалит всё, что старше этих сроков
+    NOTIFICATION_RETENTION_ENABLED: bool = False
+    # 0 — хранить без ограничения
+    NOTIFICATION_READ_RETENTION_DAYS: int = 30
+    NOTIFICATION_UNREAD_RETENTION_DAYS: int = 180
+    # неудавшиеся доставки (attempts >= NOTIFICATION_OUTBOX_MAX_ATTEMPTS) хранятся столько дней для разбора
+    NOTIFICATION_OUTBOX_FAILED_RETENTION_DAYS: int = 7
+    NOTIFICATION_PURGE_BATCH_SIZE: int = 1000
+    NOTIFICATION_PURGE_INTERVAL_SECONDS: int = 3600
     letsencrypt_email: str = ""
     letsencrypt_host: str = ""
     virtual_host: str = ""
@@ -1,6 +1,11 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
 from .config import settings
+from .pool import metered_pool
 
 
 DATABASE_URL = (
@@ -9,5 +14,71 @@ DATABASE_URL = (
 )
 
 
-engine = create_engine(DATABASE_URL, echo=False)
+def async_url(url: str):
+    return make_url(url).set(drivername="postgresql+asyncpg")
+
+
+ASYNC_DATABASE_URL = async_url(DATABASE_URL)
+
+# пулы на каждый процесс: соединений до (DB_POOL_SIZE + DB_MAX_OVERFLOW) * 2 движка * число воркеров
+POOL_OPTIONS = dict(
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+)
+
+connect_args = {}
+async_connect_args = {}
+if settings.DB_STATEMENT_TIMEOUT_MS:
+    connect_args["options"] = f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}"
+    async_connect_args["server_settings"] = {"statement_timeout": str(settings.DB_STATEMENT_TIMEOUT_MS)}
+
+
+engine = create_engine(
+    DATABASE_URL,
+    echo=False,
+    poolclass=metered_pool(QueuePool),
+    connect_args=connect_args,
+    **POOL_OPTIONS
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# expire_on_commit=False: после commit атрибуты не перечитываются неявно (в async это был бы lazy IO)
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    echo=False,
+    poolclass=metered_pool(AsyncAdaptedQueuePool),
+    connect_args=async_connect_args,
+    **POOL_OPTIONS
+)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+# реплика для чтения; без REPLICA_DATABASE_URL «читающие» сессии идут в тот же primary
+if settings.REPLICA_DATABASE_URL:
+    replica_engine = create_engine(
+        settings.REPLICA_DATABASE_URL,
+        echo=False,
+        poolclass=metered_pool(QueuePool),
+        connect_args=connect_args,
+        **POOL_OPTIONS
+    )
+    async_replica_engine = create_async_engine(
+        async_url(settings.REPLICA_DATABASE_URL),
+        echo=False,
+        poolclass=metered_pool(AsyncAdaptedQueuePool),
+        connect_args=async_connect_args,
+        **POOL_OPTIONS
+    )
+else:
+    replica_engine = engine
+    async_replica_engine = async_engine
+
+ReadSessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, bind=replica_engine, info={"replica": replica_engine is not engine}
+)
+AsyncReadSessionLocal = async_sessionmaker(
+    bind=async_replica_engine, autoflush=False, expire_on_commit=False,
+    info={"replica": async_replica_engine is not async_engine}
+)
@@ -0,0 +1,41 @@
+import math
+import threading
+from typing import Dict, Sequence
+
+DEFAULT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class LatencyHistogram:
+    """Накопительная гистограмма задержек с фиксированными корзинами в миллисекундах."""
+
+    def __init__(self, buckets_ms: Sequence[float] = DEFAULT_BUCKETS_MS):
+        self._bounds = tuple(buckets_ms) + (math.inf,)
+        self._counts = [0] * len(self._bounds)
+        self._sum_ms = 0.0
+        self._max_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        ms = seconds * 1000
+        with self._lock:
+            for i, bound in enumerate(self._bounds):
+                if ms <= bound:
+                    self._counts[i] += 1
+                    break
+            self._sum_ms += ms
+            self._max_ms = max(self._max_ms, ms)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            count = sum(self._counts)
+            cumulative = 0
+            buckets = {}
+            for bound, n in zip(self._bounds, self._counts):
+                cumulative += n
+                buckets["le_inf" if bound == math.inf else f"le_{bound:g}ms"] = cumulative
+            return {
+                "count": count,
+                "avg_ms": round(self._sum_ms / count, 3) if count else 0.0,
+                "max_ms": round(self._max_ms, 3),
+                "buckets": buckets,
+            }
@@ -0,0 +1,49 @@
+import time
+from typing import Dict, Type
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import Pool, QueuePool
+
+from app.core.metrics import LatencyHistogram
+
+
+def metered_pool(base: Type[QueuePool]) -> Type[QueuePool]:
+    """
+    Подкласс пула, замеряющий ожидание свободного соединения при checkout
+    (включая открытие нового соединения, когда пул ещё не заполнен) и считающий таймауты pool_timeout.
+
+    Гистограмма хранится на классе, поэтому переживает engine.dispose() (пул пересоздаётся тем же классом).
+    """
+
+    class MeteredPool(base):
+        wait_histogram = LatencyHistogram()
+        timeouts = 0
+
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                return super()._do_get()
+            except PoolTimeoutError:
+                type(self).timeouts += 1
+                raise
+            finally:
+                self.wait_histogram.observe(time.perf_counter() - started)
+
+    MeteredPool.__name__ = f"Metered{base.__name__}"
+    return MeteredPool
+
+
+def pool_stats(engine: Engine) -> Dict:
+    pool: Pool = engine.pool
+    stats = {
+        "pool_class": type(pool).__name__,
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+    }
+    if hasattr(pool, "wait_histogram"):
+        stats["timeouts"] = pool.timeouts
+        stats["checkout_wait"] = pool.wait_histogram.snapshot()
+    return stats
@@ -0,0 +1,41 @@
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from sqlalchemy import text
+
+from app.core.database import engine
+from app.db.create_tables import create_tables
+from app.db.rebuild_attendee_counts import rebuild_attendee_counts
+from app.db.rebuild_cities import rebuild_cities
+from app.db.rebuild_recommendations import rebuild_recommendations
+from app.db.seed_data import seed_data
+from app.db.upgrade_schema import upgrade_schema
+
+# произвольный, но постоянный ключ pg_advisory_lock для bootstrap
+BOOTSTRAP_LOCK_ID = 72120525
+
+
+def bootstrap(engine):
+    """
+    Создание таблиц, доведение существующих таблиц до текущей схемы, начальное наполнение, пересчёт справочника городов, счётчиков участников и счётчиков для рекомендаций.
+
+    Выполняется отдельной командой перед запуском приложения, а не при импорте app.main.
+    Параллельные запуски (несколько контейнеров) сериализуются advisory lock'ом:
+    второй дождётся первого и увидит, что таблицы и данные уже есть.
+    """
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as lock_conn:
+        lock_conn.execute(text("SELECT pg_advisory_lock(:lock_id)"), {"lock_id": BOOTSTRAP_LOCK_ID})
+        try:
+            create_tables(engine)
+            upgrade_schema(engine)
+            seed_data(engine)
+            rebuild_cities(engine)
+            rebuild_attendee_counts(engine)
+            rebuild_recommendations(engine)
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:lock_id)"), {"lock_id": BOOTSTRAP_LOCK_ID})
+
+
+if __name__ == "__main__":
+    bootstrap(engine)
@@ -1,4 +1,7 @@
-from app.core.database import SessionLocal
+from fastapi import Request
+
+from app.core.database import SessionLocal, AsyncSessionLocal, ReadSessionLocal, AsyncReadSessionLocal
+from app.db.read_routing import pinned_to_primary
 
 
 def get_db():
@@ -7,3 +10,23 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def get_read_db(request: Request):
+    """Сессия для read-only эндпоинтов: реплика, либо primary сразу после записи этого клиента."""
+    db = SessionLocal() if pinned_to_primary(request) else ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_read_db(request: Request):
+    session_factory = AsyncSessionLocal if pinned_to_primary(request) else AsyncReadSessionLocal
+    async with session_factory() as db:
+        yield db
@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+import jwt
+from fastapi import Request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+
+PIN_COOKIE = "db_primary_until"
+MAX_TRACKED_WRITERS = 100000
+
+_WROTE_KEY = "wrote"
+
+# состояние текущего запроса: middleware кладёт сюда словарь, события сессии отмечают запись
+_request_state: ContextVar[Optional[Dict[str, bool]]] = ContextVar("read_routing_state", default=None)
+
+
+class RecentWriters:
+    """Субъект (sub токена) -> момент, до которого его чтения идут в primary. Ограниченный LRU."""
+
+    def __init__(self, max_size: int):
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._until: "OrderedDict[str, float]" = OrderedDict()
+
+    def mark(self, subject: str, until: float):
+        with self._lock:
+            self._until[subject] = until
+            self._until.move_to_end(subject)
+            while len(self._until) > self._max_size:
+                self._until.popitem(last=False)
+
+    def pinned(self, subject: str) -> bool:
+        return self._until.get(subject, 0) > time.time()
+
+
+recent_writers = RecentWriters(MAX_TRACKED_WRITERS)
+
+
+def request_subject(request: Request) -> Optional[str]:
+    authorization = request.headers.get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except jwt.PyJWTError:
+        return None
+    return payload.get("sub")
+
+
+def pinned_to_primary(request: Request) -> bool:
+    """
+    Чтение идёт в primary в течение READ_YOUR_WRITES_SECONDS после записи того же клиента.
+    Клиента узнаём по cookie (работает между воркерами) и по sub токена (для клиентов без cookie —
+    только в пределах воркера, который выполнил запись).
+    """
+    try:
+        if float(request.cookies.get(PIN_COOKIE, 0)) > time.time():
+            return True
+    except ValueError:
+        pass
+    subject = request_subject(request)
+    return subject is not None and recent_writers.pinned(subject)
+
+
+async def track_writes(request: Request, call_next):
+    state = {_WROTE_KEY: False}
+    token = _request_state.set(state)
+    try:
+        response = await call_next(request)
+    finally:
+        _request_state.reset(token)
+
+    if state[_WROTE_KEY]:
+        until = time.time() + settings.READ_YOUR_WRITES_SECONDS
+        subject = request_subject(request)
+        if subject:
+            recent_writers.mark(subject, until)
+        response.set_cookie(
+            PIN_COOKIE, f"{until:.3f}", max_age=settings.READ_YOUR_WRITES_SECONDS, httponly=True, samesite="lax"
+        )
+    return response
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_flush(session, flush_context):
+    session.info[_WROTE_KEY] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_dml(orm_execute_state):
+    # пакетные insert/update/delete через session.execute не проходят через flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info[_WROTE_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _mark_request(session):
+    if session.info.pop(_WROTE_KEY, False):
+        state = _request_state.get()
+        if state is not None:
+            state[_WROTE_KEY] = True
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_mark(session):
+    session.info.pop(_WROTE_KEY, None)
@@ -0,0 +1,12 @@
+from sqlalchemy.orm import Session
+
+from app.services.event_service import rebuild_attendee_counts as rebuild_counts
+
+
+def rebuild_attendee_counts(engine):
+    session = Session(bind=engine)
+    try:
+        rebuild_counts(session)
+        session.commit()
+    finally:
+        session.close()
@@ -0,0 +1,12 @@
+from sqlalchemy.orm import Session
+
+from app.services.city_service import rebuild_city_counts
+
+
+def rebuild_cities(engine):
+    session = Session(bind=engine)
+    try:
+        rebuild_city_counts(session)
+        session.commit()
+    finally:
+        session.close()
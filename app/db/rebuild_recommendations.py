@@ -0,0 +1,12 @@
+from sqlalchemy.orm import Session
+
+from app.services.recommendation_service import rebuild_group_attendance
+
+
+def rebuild_recommendations(engine):
+    session = Session(bind=engine)
+    try:
+        rebuild_group_attendance(session)
+        session.commit()
+    finally:
+        session.close()
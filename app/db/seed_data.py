@@ -6,19 +6,9 @@ from app.models.models import (
     Interests, InterestsEmployers, Technologies, TechnologyEmployee,
     Ranks, Roles, EventTypes, Events, EventEmployers, Users, SystemRoles
 )
-from mimesis import Person, Internet, Datetime, Address
-from mimesis.enums import Gender
-from mimesis.locales import Locale
 
 from app.services.user_service import get_password_hash
 
-person = Person(locale=Locale.RU)
-internet = Internet()
-dt = Datetime(locale=Locale.RU)
-ru = Address(locale=Locale.RU)
-
-employees = []
-
 
 def seed_data(engine):
     session = Session(bind=engine)
@@ -112,7 +102,17 @@ def seed_data(engine):
     session.add_all(projects)
     session.flush()
 
+    # mimesis и его локали тяжёлые — грузим только когда действительно сидируем
+    from mimesis import Person, Datetime, Address
+    from mimesis.enums import Gender
+    from mimesis.locales import Locale
+
+    person = Person(locale=Locale.RU)
+    dt = Datetime(locale=Locale.RU)
+    ru = Address(locale=Locale.RU)
+
     # Генерация сотрудников со случайным отделом и позицией
+    employees = []
     for i in range(60):
         department = random.choice(departments)
         pos = random.choice(positions)
@@ -177,7 +177,8 @@ def seed_data(engine):
         date=date(2025, 6, 1),
         place="Конференц-зал 1",
         id_owner=employees[0].id_employee,
-        id_event_type=event_types[0].id_event_type
+        id_event_type=event_types[0].id_event_type,
+        attendee_count=5
     )
     session.add(event1)
     session.flush()
@@ -188,11 +189,12 @@ def seed_data(engine):
             id_employee=employees[i].id_employee
         ))
 
-    # Пользователи
+    # Пользователи (у всех один тестовый пароль — хэшируем его один раз, а не 60)
+    hashed_password = get_password_hash("password")
     for emp in employees:
         session.add(Users(
             username=f"user_{emp.id_employee.hex[:8]}",
-            hashed_password=get_password_hash("password"),
+            hashed_password=hashed_password,
             employee_id=emp.id_employee,
             role_id=system_roles[1].id_role
         ))
@@ -0,0 +1,48 @@
+from sqlalchemy import text
+
+# create_all создаёт только отсутствующие таблицы и не меняет существующие.
+# Новые колонки и индексы уже существующих таблиц добавляются здесь; каждый шаг идемпотентен,
+# поэтому выполняется при каждом bootstrap (под его advisory lock'ом).
+SCHEMA_UPGRADES = (
+    # лента уведомлений: время создания и индексы ленты / непрочитанных
+    "ALTER TABLE notifications ADD COLUMN IF NOT EXISTS created_at TIMESTAMP NOT NULL "
+    "DEFAULT (now() AT TIME ZONE 'utc')",
+    "ALTER TABLE notifications_employees ADD COLUMN IF NOT EXISTS created_at TIMESTAMP",
+    "UPDATE notifications_employees AS ne SET created_at = n.created_at "
+    "FROM notifications AS n WHERE n.id = ne.id_notification AND ne.created_at IS NULL",
+    "ALTER TABLE notifications_employees ALTER COLUMN created_at SET NOT NULL",
+    "CREATE INDEX IF NOT EXISTS ix_notifications_employees_feed "
+    "ON notifications_employees (id_employee, created_at, id_notification)",
+    "CREATE INDEX IF NOT EXISTS ix_notifications_employees_unread "
+    "ON notifications_employees (id_employee) WHERE NOT is_shown",
+    # очистка уведомлений по сроку хранения
+    "CREATE INDEX IF NOT EXISTS ix_notifications_created_at ON notifications (created_at)",
+    "CREATE INDEX IF NOT EXISTS ix_notifications_employees_created_at ON notifications_employees (created_at)",
+    # рассылки на аудиторию
+    "ALTER TABLE notifications ADD COLUMN IF NOT EXISTS audience VARCHAR(20)",
+    "ALTER TABLE notifications ADD COLUMN IF NOT EXISTS audience_id UUID",
+    "CREATE INDEX IF NOT EXISTS ix_notifications_broadcast "
+    "ON notifications (audience, audience_id, created_at) WHERE audience IS NOT NULL",
+    # календарь мероприятий и iCal-лента
+    "ALTER TABLE events ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP NOT NULL "
+    "DEFAULT (now() AT TIME ZONE 'utc')",
+    "CREATE INDEX IF NOT EXISTS ix_events_date ON events (date, id_event)",
+    "CREATE INDEX IF NOT EXISTS ix_events_owner_date ON events (id_owner, date)",
+    "CREATE INDEX IF NOT EXISTS ix_event_employers_employee ON event_employers (id_employee, id_event)",
+    "ALTER TABLE employers ADD COLUMN IF NOT EXISTS calendar_secret VARCHAR(32)",
+    # счётчик участников; значения заполняет rebuild_attendee_counts
+    "ALTER TABLE events ADD COLUMN IF NOT EXISTS attendee_count INTEGER NOT NULL DEFAULT 0",
+    # группы сотрудника для рекомендаций; event_group_attendance создаёт create_tables
+    "CREATE INDEX IF NOT EXISTS ix_projects_employers_employee ON projects_employers (id_employee)",
+    "CREATE INDEX IF NOT EXISTS ix_interests_employers_employee ON interests_employers (id_employee)",
+    # проверка уникальности при импорте сотрудников — по пачке, одним запросом
+    "CREATE INDEX IF NOT EXISTS ix_employers_email ON employers (email)",
+    "CREATE INDEX IF NOT EXISTS ix_employers_phone_number ON employers (phone_number)",
+    "CREATE INDEX IF NOT EXISTS ix_employers_telegram_name ON employers (telegram_name)",
+)
+
+
+def upgrade_schema(engine):
+    with engine.begin() as conn:
+        for statement in SCHEMA_UPGRADES:
+            conn.execute(text(statement))
@@ -0,0 +1,96 @@
+"""
+Профиль импорта приложения: python -m app.import_profile [--budget-ms 1500] [--top 20]
+
+Запускает `python -X importtime -c "import app.main"` в отдельном процессе, печатает самые дорогие
+модули и пакеты и завершается с кодом 1, если импорт дольше бюджета или подтянул модули,
+которые должны грузиться лениво (сидирование, генераторы тестовых данных).
+"""
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, NamedTuple
+
+# модули, которые не должны попадать в холодный старт воркера
+LAZY_MODULES = ("mimesis", "app.db.seed_data", "app.db.bootstrap", "gunicorn")
+
+
+class ImportRecord(NamedTuple):
+    name: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def profile_imports(module: str) -> List[ImportRecord]:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env=os.environ,
+    )
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr)
+        raise SystemExit(f"Не удалось импортировать {module}")
+
+    records = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        records.append(ImportRecord(
+            name=name.strip(),
+            self_us=int(self_us),
+            cumulative_us=int(cumulative_us),
+            depth=(len(name) - len(name.lstrip())) // 2,
+        ))
+    return records
+
+
+def by_package(records: List[ImportRecord]) -> Dict[str, int]:
+    totals: Dict[str, int] = defaultdict(int)
+    for record in records:
+        package = record.name.split(".")[0]
+        if package == "app":
+            package = ".".join(record.name.split(".")[:2])
+        totals[package] += record.self_us
+    return totals
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--budget-ms", type=float, default=1500)
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    records = profile_imports(args.module)
+    total_ms = sum(record.self_us for record in records) / 1000
+
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for record in sorted(records, key=lambda r: r.cumulative_us, reverse=True)[:args.top]:
+        print(f"{record.cumulative_us / 1000:>14.1f} {record.self_us / 1000:>9.1f}  {record.name}")
+
+    print(f"\n{'self ms':>9}  package")
+    for package, self_us in sorted(by_package(records).items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"{self_us / 1000:>9.1f}  {package}")
+
+    print(f"\nИтого: {total_ms:.1f} ms, бюджет {args.budget_ms:.0f} ms")
+
+    failed = False
+    leaked = sorted({
+        record.name for record in records
+        if any(record.name == lazy or record.name.startswith(lazy + ".") for lazy in LAZY_MODULES)
+    })
+    if leaked:
+        print(f"Лениво загружаемые модули попали в импорт {args.module}: {', '.join(leaked)}")
+        failed = True
+    if total_ms > args.budget_ms:
+        print("Импорт превышает бюджет")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
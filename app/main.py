@@ -1,3 +1,6 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 
@@ -5,20 +8,37 @@ load_dotenv()
 
 from app.core.config import settings
 from fastapi import FastAPI
-from app.core.database import engine
-from app.api.v1 import employee, user, graph, common, event
+from app.api.v1 import employee, user, graph, common, event, internal, health
 from fastapi import APIRouter
 
-from app.db.create_tables import create_tables
-from app.db.seed_data import seed_data
+from app.db.read_routing import track_writes
+from app.services.notification_hub import run_notification_listener
+from app.services.notification_retention import run_notification_purge
+from app.services.notification_service import run_outbox_worker
+from app.services.revocation_store import run_revocation_purge
+from app.services.warmup import warm_up
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # прогрев идёт в фоне: liveness отвечает сразу, readiness — после прогрева
+    tasks = [asyncio.create_task(warm_up()), asyncio.create_task(run_revocation_purge())]
+    if settings.NOTIFICATION_OUTBOX_WORKER:
+        tasks.append(asyncio.create_task(run_outbox_worker()))
+    if settings.NOTIFICATION_PUSH_ENABLED:
+        tasks.append(asyncio.create_task(run_notification_listener()))
+    if settings.NOTIFICATION_RETENTION_ENABLED:
+        tasks.append(asyncio.create_task(run_notification_purge()))
+    yield
+    for task in tasks:
+        task.cancel()
 
 
 def get_application() -> FastAPI:
-    create_tables(engine)
-    seed_data(engine)
     app = FastAPI(
         title="My Basic FastAPI App",
         version="1.0.0",
+        lifespan=lifespan,
     )
     v1_router = APIRouter(prefix='/api/v1')
     v1_router.include_router(employee.router)
@@ -26,9 +46,13 @@ def get_application() -> FastAPI:
     v1_router.include_router(graph.router)
     v1_router.include_router(common.router)
     v1_router.include_router(event.router)
+    v1_router.include_router(internal.router)
+    v1_router.include_router(health.router)
 
     app.include_router(v1_router)
 
+    app.middleware("http")(track_writes)
+
     origins = ["*"]
 
     app.add_middleware(
@@ -45,5 +69,5 @@ def get_application() -> FastAPI:
 app = get_application()
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run("app.main:app", host="0.0.0.0", port=settings.PORT, reload=True)
+    from app.serve import main
+    main()
@@ -1,12 +1,13 @@
 import uuid
+from datetime import datetime
 
 from sqlalchemy import (
     Column,
     String,
     Date,
-    ForeignKey, Boolean,
+    ForeignKey, Boolean, Integer, BigInteger, DateTime, Index, text,
 )
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import UUID, ARRAY
 from sqlalchemy.orm import declarative_base, relationship
 
 Base = declarative_base()
@@ -27,21 +28,35 @@ class Employers(Base):
     last_name = Column(String(52), nullable=False)
     middle_name = Column(String(52), nullable=True)
     date_of_birth = Column(Date, nullable=False)
-    email = Column(String(150), nullable=False)
-    phone_number = Column(String(18), nullable=False)
-    telegram_name = Column(String(25), nullable=False)
+    email = Column(String(150), nullable=False, index=True)
+    phone_number = Column(String(18), nullable=False, index=True)
+    telegram_name = Column(String(25), nullable=False, index=True)
     city = Column(String(52), nullable=False)
     id_position = Column(UUID(as_uuid=True), ForeignKey("positions.id_position"))
     id_department = Column(UUID(as_uuid=True), ForeignKey("departments.id_department"))
+    # секрет ссылки на iCal-ленту; выдаётся при первом запросе ссылки, смена отзывает прежнюю
+    calendar_secret = Column(String(32), nullable=True)
 
     user = relationship("Users", uselist=False, back_populates="employee")
 
 
+class Cities(Base):
+    __tablename__ = "cities"
+
+    id_city = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    name_city = Column(String(52), nullable=False, unique=True)
+    headcount = Column(Integer, nullable=False, default=0)
+
+
 class InterestsEmployers(Base):
     __tablename__ = "interests_employers"
     id_interest = Column(UUID(as_uuid=True), ForeignKey("interests.id_interest"), primary_key=True)
     id_employee = Column(UUID(as_uuid=True), ForeignKey("employers.id_employee"), primary_key=True)
 
+    __table_args__ = (
+        Index("ix_interests_employers_employee", "id_employee"),
+    )
+
 
 class Events(Base):
     __tablename__ = "events"
@@ -52,6 +67,14 @@ class Events(Base):
     place = Column(String(52), nullable=False)
     id_owner = Column(UUID(as_uuid=True), ForeignKey("employers.id_employee"))
     id_event_type = Column(UUID(as_uuid=True), ForeignKey("event_types.id_event_type"))
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # поддерживается теми же запросами, что добавляют и удаляют строки event_employers
+    attendee_count = Column(Integer, nullable=False, default=0, server_default=text("0"))
+
+    __table_args__ = (
+        Index("ix_events_date", "date", "id_event"),
+        Index("ix_events_owner_date", "id_owner", "date"),
+    )
 
 
 class EventEmployers(Base):
@@ -59,6 +82,28 @@ class EventEmployers(Base):
     id_event = Column(UUID(as_uuid=True), ForeignKey("events.id_event"), primary_key=True)
     id_employee = Column(UUID(as_uuid=True), ForeignKey("employers.id_employee"), primary_key=True)
 
+    # первичный ключ начинается с id_event; мероприятия сотрудника ищутся по этому индексу
+    __table_args__ = (
+        Index("ix_event_employers_employee", "id_employee", "id_event"),
+    )
+
+
+class EventGroupAttendance(Base):
+    """
+    Сколько участников мероприятия входит в группу (проект, отдел, интерес).
+    Поддерживается теми же запросами, что меняют event_employers; источник для рекомендаций мероприятий.
+    """
+    __tablename__ = "event_group_attendance"
+
+    id_event = Column(UUID(as_uuid=True), ForeignKey("events.id_event"), primary_key=True)
+    group_kind = Column(String(12), primary_key=True)
+    id_group = Column(UUID(as_uuid=True), primary_key=True)
+    attendees = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_event_group_attendance_group", "group_kind", "id_group", "id_event"),
+    )
+
 
 class EventTypes(Base):
     __tablename__ = "event_types"
@@ -88,6 +133,10 @@ class ProjectsEmployers(Base):
     id_employee = Column(UUID(as_uuid=True), ForeignKey("employers.id_employee"), primary_key=True)
     id_project = Column(UUID(as_uuid=True), ForeignKey("projects.id_project"), primary_key=True)
 
+    __table_args__ = (
+        Index("ix_projects_employers_employee", "id_employee"),
+    )
+
 
 class Roles(Base):
     __tablename__ = "roles"
@@ -144,6 +193,25 @@ class Users(Base):
     employee = relationship("Employers", back_populates="user")
 
 
+class RevokedTokens(Base):
+    __tablename__ = "revoked_tokens"
+
+    jti = Column(String(64), primary_key=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    revoked_at = Column(DateTime, nullable=False, index=True)
+
+
+class LoginThrottle(Base):
+    __tablename__ = "login_throttle"
+
+    key = Column(String(128), primary_key=True)
+    window = Column(BigInteger, nullable=False)
+    current = Column(Integer, nullable=False)
+    previous = Column(Integer, nullable=False)
+    banned_until = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, nullable=False, index=True)
+
+
 class SystemRoles(Base):
     __tablename__ = "system_roles"
     id_role = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -154,6 +222,18 @@ class Notifications(Base):
     __tablename__ = "notifications"
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     content = Column(String(500), nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    # рассылка: None — персональное (получатели в notifications_employees),
+    # иначе all / department / project / event, а получатели вычисляются при чтении
+    audience = Column(String(20), nullable=True)
+    audience_id = Column(UUID(as_uuid=True), nullable=True)
+
+    __table_args__ = (
+        Index(
+            "ix_notifications_broadcast", "audience", "audience_id", "created_at",
+            postgresql_where=text("audience IS NOT NULL")
+        ),
+    )
 
 
 class NotificationsEmployees(Base):
@@ -162,3 +242,30 @@ class NotificationsEmployees(Base):
     id_notification = Column(UUID(as_uuid=True), ForeignKey("notifications.id"), primary_key=True)
     id_employee = Column(UUID(as_uuid=True), ForeignKey("employers.id_employee"), primary_key=True)
     is_shown = Column(Boolean, nullable=False)
+    # копия notifications.created_at: лента сотрудника читается по одному индексу без join для сортировки
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_notifications_employees_feed", "id_employee", "created_at", "id_notification"),
+        Index("ix_notifications_employees_unread", "id_employee", postgresql_where=text("NOT is_shown")),
+        Index("ix_notifications_employees_created_at", "created_at"),
+    )
+
+
+class NotificationReads(Base):
+    """Отметки о прочтении рассылок: строка появляется, только когда сотрудник прочитал рассылку."""
+    __tablename__ = "notification_reads"
+
+    id_notification = Column(UUID(as_uuid=True), ForeignKey("notifications.id"), primary_key=True)
+    id_employee = Column(UUID(as_uuid=True), ForeignKey("employers.id_employee"), primary_key=True)
+    read_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class NotificationOutbox(Base):
+    __tablename__ = "notification_outbox"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id_notification = Column(UUID(as_uuid=True), ForeignKey("notifications.id"), nullable=False)
+    recipient_ids = Column(ARRAY(UUID(as_uuid=True)), nullable=False)
+    created_at = Column(DateTime, nullable=False, index=True)
+    attempts = Column(Integer, nullable=False, default=0)
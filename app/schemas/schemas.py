@@ -1,9 +1,9 @@
 import re
 
 from pydantic import BaseModel, constr, EmailStr, field_validator, model_validator, ConfigDict
-from typing import Optional, List, Union
+from typing import Optional, List, Union, Literal
 from uuid import UUID
-from datetime import date
+from datetime import date, datetime
 
 
 class MessageDTO(BaseModel):
@@ -42,6 +42,14 @@ class DepartmentRead(BaseModel):
     name_department: str
 
 
+class CityRead(BaseModel):
+    id_city: UUID
+    name_city: str
+    headcount: int
+
+    model_config = ConfigDict(from_attributes=True)
+
+
 class RoleRead(BaseModel):
     id_role: UUID
     name_role: str
@@ -305,6 +313,7 @@ class EventRead(BaseModel):
     owner: EmployeeSummary
     event_type: EventTypeRead
     attendees: List[EmployeeSummary] = []
+    attendee_count: int = 0
 
     class Config:
         orm_mode = True
@@ -319,6 +328,7 @@ class EventRead(BaseModel):
             owner=owner_summary,
             event_type=event_type_summary,
             attendees=attendees,
+            attendee_count=event.attendee_count or 0,
         )
 
 
@@ -330,10 +340,43 @@ class PaginatedEvents(BaseModel):
     events: List[EventRead]
 
 
+class AttendeePage(BaseModel):
+    items: List[EmployeeSummary]
+    next_cursor: Optional[str] = None
+
+
+class CalendarEvents(BaseModel):
+    events: List[EventRead]
+    next_cursor: Optional[str] = None
+
+
+class RecommendedEvent(BaseModel):
+    event: EventRead
+    score: int
+
+
+class CalendarLink(BaseModel):
+    url: str
+
+
 class NotificationCreate(BaseModel):
     content: str
 
 
+class BroadcastCreate(BaseModel):
+    content: constr(strip_whitespace=True, min_length=1, max_length=500)
+    audience: Literal["all", "department", "project", "event"]
+    audience_id: Optional[UUID] = None
+
+    @model_validator(mode="after")
+    def check_audience_id(self):
+        if self.audience == "all":
+            self.audience_id = None
+        elif self.audience_id is None:
+            raise ValueError("Для audience department/project/event нужно указать audience_id")
+        return self
+
+
 class NotificationReadRequest(BaseModel):
     notification_ids: List[UUID]
 
@@ -342,11 +385,26 @@ class NotificationOut(BaseModel):
     id: UUID
     content: str
     is_shown: bool
+    created_at: Optional[datetime] = None
 
     class Config:
         orm_mode = True
 
 
+class NotificationPage(BaseModel):
+    items: List[NotificationOut]
+    next_cursor: Optional[str] = None
+
+
+class UnreadCount(BaseModel):
+    unread: int
+
+
+class NotificationStreamToken(BaseModel):
+    token: str
+    expires_in: int
+
+
 class EmployeePositionDepartmentUpdate(BaseModel):
     position_name: Optional[str] = None
     department_name: Optional[str] = None
@@ -354,3 +412,31 @@ class EmployeePositionDepartmentUpdate(BaseModel):
 
 class MessageDTO(BaseModel):
     message: str
+
+
+class EmployeeImportRow(HrEmployeeUpdate):
+    id_employee: Optional[UUID] = None
+
+    @field_validator('id_employee', mode='before')
+    def empty_id_to_none(cls, v):
+        return v or None
+
+
+class EmployeeImportRowError(BaseModel):
+    row: int
+    errors: List[str]
+
+
+class EmployeeImportDeleteError(BaseModel):
+    id_employee: UUID
+    errors: List[str]
+
+
+class EmployeeImportResult(BaseModel):
+    created: int
+    updated: int
+    unchanged: int
+    deleted: int
+    delete_skipped: bool = False
+    errors: List[EmployeeImportRowError]
+    delete_errors: List[EmployeeImportDeleteError] = []
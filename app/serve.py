@@ -0,0 +1,86 @@
+import multiprocessing
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.core.config import settings
+
+
+def warm_up():
+    """Заполняет процессные кэши до fork, чтобы воркеры стартовали с готовыми справочниками."""
+    from app.core.database import SessionLocal
+    from app.services.reference_cache import REFERENCE_TABLES, reference_cache
+
+    with SessionLocal() as db:
+        for name in REFERENCE_TABLES:
+            reference_cache.get(db, name)
+
+
+def reset_connections():
+    """После fork соединения родителя не используются: каждый воркер открывает свои."""
+    from app.core.database import engine, async_engine, replica_engine, async_replica_engine
+
+    for sync_engine in {engine, replica_engine, async_engine.sync_engine, async_replica_engine.sync_engine}:
+        sync_engine.dispose(close=False)
+
+
+def gunicorn_options() -> dict:
+    return {
+        "bind": f"0.0.0.0:{settings.PORT}",
+        # UvicornWorker сам выбирает uvloop и httptools, если они установлены (uvicorn[standard])
+        "worker_class": "uvicorn_worker.UvicornWorker",
+        "workers": settings.WEB_WORKERS or multiprocessing.cpu_count(),
+        "preload_app": settings.WEB_PRELOAD,
+        "max_requests": settings.WEB_MAX_REQUESTS,
+        "max_requests_jitter": settings.WEB_MAX_REQUESTS_JITTER,
+        "timeout": settings.WEB_TIMEOUT,
+        "graceful_timeout": settings.WEB_GRACEFUL_TIMEOUT,
+        "keepalive": settings.WEB_KEEPALIVE,
+        "accesslog": "-",
+        "post_fork": lambda server, worker: reset_connections(),
+    }
+
+
+def run_production():
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def __init__(self, options: dict):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from app.main import app
+
+            if settings.WEB_PRELOAD:
+                warm_up()
+            return app
+
+    Server(gunicorn_options()).run()
+
+
+def run_development():
+    import uvicorn
+    from app.core.database import engine
+    from app.db.bootstrap import bootstrap
+
+    # в dev схема и тестовые данные готовятся один раз, а не при каждой перезагрузке
+    bootstrap(engine)
+
+    uvicorn.run("app.main:app", host="0.0.0.0", port=settings.PORT, reload=True)
+
+
+def main():
+    if settings.WEB_RELOAD:
+        run_development()
+    else:
+        run_production()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import hashlib
+import hmac
+import secrets
+from datetime import date, datetime, timedelta
+from typing import Iterator
+from uuid import UUID
+
+from fastapi import HTTPException
+from sqlalchemy import select, func, cast, literal, String
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import ReadSessionLocal
+from app.models.models import Employers, Events
+from app.services.event_service import agenda_event_ids
+
+ICAL_PRODID = "-//connecticus//events//RU"
+
+
+def calendar_token(employee_id: UUID, secret: str) -> str:
+    """
+    Подпись ссылки на iCal-ленту: календари подписываются без заголовка Authorization.
+    В подпись входит секрет сотрудника — его смена отзывает ссылку, удаление сотрудника тоже.
+    """
+    return hmac.new(
+        settings.SECRET_KEY.encode(), f"ical:{employee_id}:{secret}".encode(), hashlib.sha256
+    ).hexdigest()[:32]
+
+
+async def issue_calendar_secret(db: AsyncSession, employee_id: UUID, rotate: bool = False) -> str:
+    """Секрет ссылки сотрудника: создаётся при первом запросе, при rotate заменяется новым."""
+    employee = await db.get(Employers, employee_id)
+    if employee is None:
+        raise HTTPException(status_code=404, detail="Employee not found")
+    if rotate or not employee.calendar_secret:
+        employee.calendar_secret = secrets.token_hex(16)
+        await db.commit()
+    return employee.calendar_secret
+
+
+async def check_calendar_token(db: AsyncSession, employee_id: UUID, token: str):
+    secret = await db.scalar(select(Employers.calendar_secret).where(Employers.id_employee == employee_id))
+    if not secret or not hmac.compare_digest(calendar_token(employee_id, secret), token):
+        raise HTTPException(status_code=404, detail="Календарь не найден")
+
+
+def agenda_window_start() -> date:
+    return date.today() - timedelta(days=settings.EVENTS_ICAL_PAST_DAYS)
+
+
+async def agenda_etag(db: AsyncSession, employee_id: UUID, date_from: date) -> str:
+    """
+    ETag ленты одним агрегатом без чтения самих мероприятий: набор id меняется при join/leave/удалении,
+    max(updated_at) — при редактировании, date_from — со сменой дня.
+    """
+    ids, last_update = (await db.execute(
+        select(
+            func.md5(func.string_agg(
+                cast(Events.id_event, String), aggregate_order_by(literal(","), Events.id_event)
+            )),
+            func.max(Events.updated_at),
+        ).where(Events.id_event.in_(agenda_event_ids(employee_id, date_from)))
+    )).one()
+    raw = f"{employee_id}|{date_from.isoformat()}|{ids}|{last_update.isoformat() if last_update else ''}"
+    return '"' + hashlib.sha1(raw.encode()).hexdigest() + '"'
+
+
+def _escape(value: str) -> str:
+    return (
+        value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+    )
+
+
+def _fold(line: str) -> str:
+    # RFC 5545: строки длиннее 75 октетов переносятся с пробелом в начале продолжения
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return line + "\r\n"
+    parts, chunk = [], b""
+    for char in line:
+        char_bytes = char.encode()
+        if len(chunk) + len(char_bytes) > (75 if not parts else 74):
+            parts.append(chunk.decode())
+            chunk = b""
+        chunk += char_bytes
+    parts.append(chunk.decode())
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def _vevent(row, stamp: str) -> str:
+    updated = row.updated_at.strftime("%Y%m%dT%H%M%SZ") if row.updated_at else stamp
+    return "".join(_fold(line) for line in (
+        "BEGIN:VEVENT",
+        f"UID:{row.id_event}@connecticus",
+        f"DTSTAMP:{updated}",
+        f"LAST-MODIFIED:{updated}",
+        f"DTSTART;VALUE=DATE:{row.date.strftime('%Y%m%d')}",
+        f"DTEND;VALUE=DATE:{(row.date + timedelta(days=1)).strftime('%Y%m%d')}",
+        f"SUMMARY:{_escape(row.name_event)}",
+        f"LOCATION:{_escape(row.place)}",
+        "END:VEVENT",
+    ))
+
+
+def stream_agenda_ical(employee_id: UUID, date_from: date) -> Iterator[str]:
+    """
+    Генератор iCal-ленты мероприятий сотрудника начиная с date_from.
+
+    Как и выгрузка справочника, читает серверным курсором пачками по EVENTS_ICAL_BATCH_SIZE;
+    сессия (с реплики) открывается внутри генератора, потому что он выполняется уже после выхода из обработчика.
+    """
+    db = ReadSessionLocal()
+    try:
+        yield "".join(_fold(line) for line in (
+            "BEGIN:VCALENDAR",
+            "VERSION:2.0",
+            f"PRODID:{ICAL_PRODID}",
+            "CALSCALE:GREGORIAN",
+            "X-WR-CALNAME:Мероприятия",
+        ))
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+        result = db.execute(
+            select(Events.id_event, Events.name_event, Events.place, Events.date, Events.updated_at)
+            .where(Events.id_event.in_(agenda_event_ids(employee_id, date_from)))
+            .order_by(Events.date, Events.id_event)
+            .execution_options(yield_per=settings.EVENTS_ICAL_BATCH_SIZE)
+        )
+        for partition in result.partitions():
+            yield "".join(_vevent(row, stamp) for row in partition)
+        yield _fold("END:VCALENDAR")
+    finally:
+        db.close()
@@ -0,0 +1,63 @@
+from collections import Counter
+from typing import Iterable
+
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.models.models import Cities, Employers
+
+
+def apply_city_changes(db: Session, removed: Iterable[str] = (), added: Iterable[str] = ()):
+    """
+    Поддерживает счётчик сотрудников в таблице cities.
+    Изменения применяются в транзакции вызывающего кода: прибавления одним upsert-ом, убавления одним
+    пакетным UPDATE. Строки с нулевым счётчиком не удаляются, чтобы id города оставался стабильным.
+    """
+    deltas = Counter(added)
+    deltas.subtract(Counter(removed))
+    increments = [
+        {"name_city": name, "headcount": delta}
+        for name, delta in sorted(deltas.items())
+        if name and delta > 0
+    ]
+    decrements = [
+        {"city_name": name, "delta": -delta}
+        for name, delta in sorted(deltas.items())
+        if name and delta < 0
+    ]
+
+    if increments:
+        stmt = insert(Cities).values(increments)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Cities.name_city],
+            set_={"headcount": Cities.headcount + stmt.excluded.headcount},
+        )
+        db.execute(stmt)
+
+    if decrements:
+        # Core-таблица: executemany по списку параметров, а не ORM bulk update по первичному ключу
+        cities = Cities.__table__
+        db.execute(
+            update(cities)
+                .where(cities.c.name_city == bindparam("city_name"))
+                .values(headcount=func.greatest(cities.c.headcount - bindparam("delta"), 0)),
+            decrements,
+        )
+
+
+def rebuild_city_counts(db: Session):
+    """
+    Полный пересчёт счётчиков по таблице employers — для первичного заполнения и сверки.
+    """
+    counts = (
+        select(func.gen_random_uuid(), Employers.city, func.count())
+            .group_by(Employers.city)
+    )
+    db.execute(update(Cities).values(headcount=0))
+    stmt = insert(Cities).from_select([Cities.id_city, Cities.name_city, Cities.headcount], counts)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Cities.name_city],
+        set_={"headcount": stmt.excluded.headcount},
+    )
+    db.execute(stmt)
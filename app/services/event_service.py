@@ -1,27 +1,37 @@
+import base64
+from collections import defaultdict
+from datetime import date
 from math import ceil
-from typing import List
+from typing import List, Optional, Sequence, Tuple
 from uuid import UUID
 
-from sqlalchemy import or_
+from sqlalchemy import or_, select, func, delete, update, union, tuple_, any_, bindparam, true
+from sqlalchemy.dialects.postgresql import insert, ARRAY, UUID as PG_UUID
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from fastapi import HTTPException
 
 from app.models.models import (
     Events,
     EventEmployers,
-    Employers, EventTypes,
+    Employers, EventTypes, EventGroupAttendance,
 )
 from app.schemas.schemas import (
     EventCreate,
     EventUpdate,
     EventRead,
     PaginatedEvents,
+    CalendarEvents,
+    AttendeePage,
     EmployeeSummary, EventTypeRead,
 )
-from app.services.user_service import create_notification
+from app.core.config import settings
+from app.services.reference_cache import reference_cache
+from app.services.notification_service import enqueue_notification
+from app.services.recommendation_service import shift_group_attendance
 
 
-def create_event(db: Session, owner_id: UUID, event_in: EventCreate) -> Events:
+async def create_event(db: AsyncSession, owner_id: UUID, event_in: EventCreate) -> Events:
     new_event = Events(
         name_event=event_in.name_event.strip(),
         date=event_in.date,
@@ -30,81 +40,117 @@ def create_event(db: Session, owner_id: UUID, event_in: EventCreate) -> Events:
         id_event_type=event_in.id_event_type,
     )
     db.add(new_event)
-    db.flush()  # чтобы получить new_event.id_event
+    await db.flush()  # чтобы получить new_event.id_event
     return new_event
 
 
-def add_attendee(db: Session, event_id: UUID, employee_id: UUID):
-    # Проверим, что событие существует
-    event = db.query(Events).filter_by(id_event=event_id).first()
-    if not event:
-        raise HTTPException(status_code=404, detail="Событие не найдено")
+def attach_attendees_statement(event_id: UUID, employee_ids: List[UUID]):
+    """
+    Один запрос: INSERT ... ON CONFLICT DO NOTHING в event_employers и увеличение attendee_count
+    (и счётчиков групп в event_group_attendance) ровно на число вставленных строк. Несуществующие мероприятие или сотрудники просто не вставляются.
+    Возвращает (name_event, добавлено) или ничего, если не добавлен никто.
+    """
+    joined = (
+        insert(EventEmployers)
+        .from_select(
+            ["id_event", "id_employee"],
+            select(Events.id_event, Employers.id_employee).where(
+                Events.id_event == event_id,
+                Employers.id_employee == any_(bindparam("employee_ids", employee_ids, type_=ARRAY(PG_UUID(as_uuid=True)))),
+            )
+        )
+        .on_conflict_do_nothing()
+        .returning(EventEmployers.id_event, EventEmployers.id_employee)
+        .cte("joined")
+    )
+    return _shift_attendee_count(joined, +1)
 
-    # Проверим, что сотрудник существует
-    emp = db.query(Employers).filter_by(id_employee=employee_id).first()
-    if not emp:
-        raise HTTPException(status_code=404, detail="Сотрудник не найден")
 
-    # Проверим, нет ли уже связи
-    exists = db.query(EventEmployers).filter_by(
-        id_event=event_id, id_employee=employee_id
-    ).first()
-    if exists:
-        raise HTTPException(status_code=400, detail="Сотрудник уже добавлен в мероприятие")
+def detach_attendees_statement(*criteria):
+    """Один запрос: DELETE ... RETURNING из event_employers и уменьшение attendee_count затронутых мероприятий."""
+    removed = (
+        delete(EventEmployers)
+        .where(*criteria)
+        .returning(EventEmployers.id_event, EventEmployers.id_employee)
+        .cte("removed")
+    )
+    return _shift_attendee_count(removed, -1)
+
 
-    link = EventEmployers(id_event=event_id, id_employee=employee_id)
-    db.add(link)
+def _shift_attendee_count(changed, sign: int):
+    counts = (
+        select(changed.c.id_event, func.count().label("changed"))
+        .group_by(changed.c.id_event)
+        .subquery()
+    )
+    return (
+        update(Events)
+        .where(Events.id_event == counts.c.id_event)
+        # updated_at не трогаем: счётчик не входит в iCal-ленту и не должен сбрасывать её ETag
+        .values(attendee_count=Events.attendee_count + sign * counts.c.changed, updated_at=Events.updated_at)
+        .returning(Events.name_event, counts.c.changed)
+        # счётчики групп для рекомендаций — в том же запросе
+        .add_cte(shift_group_attendance(changed, sign))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def rebuild_attendee_counts(db: Session):
+    """
+    Полный пересчёт attendee_count по event_employers — для первичного заполнения и сверки.
+    Обновляются только расходящиеся строки; updated_at не меняется, как и при join/leave.
+    """
+    actual = func.coalesce(
+        select(func.count())
+        .where(EventEmployers.id_event == Events.id_event)
+        .scalar_subquery(),
+        0
+    )
+    db.execute(
+        update(Events)
+        .where(Events.attendee_count.is_distinct_from(actual))
+        .values(attendee_count=actual, updated_at=Events.updated_at)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def add_attendee(db: AsyncSession, event_id: UUID, employee_id: UUID):
+    added = (await db.execute(attach_attendees_statement(event_id, [employee_id]))).first()
+    if added:
+        return
+
+    # проверки — только для ответа с понятной ошибкой, в обычном случае это один запрос
+    if not await db.get(Events, event_id):
+        raise HTTPException(status_code=404, detail="Событие не найдено")
+    if not await db.get(Employers, employee_id):
+        raise HTTPException(status_code=404, detail="Сотрудник не найден")
+    raise HTTPException(status_code=400, detail="Сотрудник уже добавлен в мероприятие")
 
 
-def remove_attendee(db: Session, event_id: UUID, employee_id: UUID):
-    link = db.query(EventEmployers).filter_by(
-        id_event=event_id, id_employee=employee_id
-    ).first()
-    if not link:
+async def remove_attendee(db: AsyncSession, event_id: UUID, employee_id: UUID):
+    removed = (await db.execute(detach_attendees_statement(
+        EventEmployers.id_event == event_id,
+        EventEmployers.id_employee == employee_id,
+    ))).first()
+    if not removed:
         raise HTTPException(status_code=404, detail="Сотрудник не участвует в этом мероприятии")
-    db.delete(link)
 
 
-def get_event(db: Session, event_id: UUID) -> EventRead:
-    # 1) Получаем само мероприятие
-    event = db.query(Events).filter_by(id_event=event_id).first()
+async def get_event(db: AsyncSession, event_id: UUID) -> EventRead:
+    event = await db.get(Events, event_id)
     if not event:
         raise HTTPException(status_code=404, detail="Мероприятие не найдено")
+    return (await build_event_reads(db, [event]))[0]
 
-    # 2) Собираем участников – но сразу конвертируем в EmployeeSummary
-    employer_objs = (
-        db.query(Employers)
-        .join(EventEmployers, EventEmployers.id_employee == Employers.id_employee)
-        .filter(EventEmployers.id_event == event_id)
-        .all()
-    )
-    attendees_summaries = [EmployeeSummary.from_orm(emp) for emp in employer_objs]
-    event_type_obj = db.query(EventTypes).filter_by(id_event_type=event.id_event_type).first()
-    if not event_type_obj:
-        raise HTTPException(status_code=404, detail="Тип события не найден")
-    event_type_summary = EventTypeRead.from_orm(event_type_obj)
-
-    owner_obj = db.query(Employers).filter_by(id_employee=event.id_owner).first()
-    if not owner_obj:
-        raise HTTPException(status_code=404, detail="Организатор не найден")
-    owner_summary = EmployeeSummary.from_orm(owner_obj)
-
-    return EventRead.from_orm(
-        event,
-        attendees=attendees_summaries,
-        event_type_summary=event_type_summary,
-        owner_summary=owner_summary
-    )
 
-
-def list_events(
-    db: Session, search: str, skip: int = 0, limit: int = 10
+async def list_events(
+    db: AsyncSession, search: str, skip: int = 0, limit: int = 10
 ) -> PaginatedEvents:
-    query = db.query(Events).join(EventTypes, Events.id_event_type == EventTypes.id_event_type)
+    query = select(Events).join(EventTypes, Events.id_event_type == EventTypes.id_event_type)
 
     if search:
         pattern = f"%{search.lower()}%"
-        query = query.filter(
+        query = query.where(
             or_(
                 Events.name_event.ilike(pattern),
                 Events.place.ilike(pattern),
@@ -112,43 +158,15 @@ def list_events(
             )
         )
 
-    total = db.query(Events).count()
-    events = (
+    total = await db.scalar(select(func.count()).select_from(Events))
+    events = (await db.scalars(
         query
         .order_by(Events.date.desc())
         .offset(skip)
         .limit(limit)
-        .all()
-    )
+    )).all()
 
-    result: List[EventRead] = []
-    for ev in events:
-        employer_objs = (
-            db.query(Employers)
-            .join(EventEmployers, EventEmployers.id_employee == Employers.id_employee)
-            .filter(EventEmployers.id_event == ev.id_event)
-            .all()
-        )
-        attendees_summaries = [EmployeeSummary.from_orm(emp) for emp in employer_objs]
-
-        event_type_obj = db.query(EventTypes).filter_by(id_event_type=ev.id_event_type).first()
-        if not event_type_obj:
-            raise HTTPException(status_code=404, detail="Тип события не найден")
-        event_type_summary = EventTypeRead.from_orm(event_type_obj)
-
-        owner_obj = db.query(Employers).filter_by(id_employee=ev.id_owner).first()
-        if not owner_obj:
-            raise HTTPException(status_code=404, detail="Организатор не найден")
-        owner_summary = EmployeeSummary.from_orm(owner_obj)
-
-        result.append(
-            EventRead.from_orm(
-                ev,
-                attendees=attendees_summaries,
-                event_type_summary=event_type_summary,
-                owner_summary=owner_summary
-            )
-        )
+    result = await build_event_reads(db, events)
 
     return PaginatedEvents(
         total_count=total,
@@ -159,18 +177,18 @@ def list_events(
     )
 
 
-def list_my_events(
-    db: Session,
+async def list_my_events(
+    db: AsyncSession,
     employee_id: UUID,
     search: str,
     skip: int = 0,
     limit: int = 10
 ) -> PaginatedEvents:
-    q = db.query(Events).join(EventTypes, Events.id_event_type == EventTypes.id_event_type)
+    q = select(Events).join(EventTypes, Events.id_event_type == EventTypes.id_event_type)
 
     if search:
         pattern = f"%{search.lower()}%"
-        q = q.filter(
+        q = q.where(
             or_(
                 Events.name_event.ilike(pattern),
                 Events.place.ilike(pattern),
@@ -179,14 +197,13 @@ def list_my_events(
         )
 
     subq = (
-        db.query(EventEmployers.id_event)
-          .filter(EventEmployers.id_employee == employee_id)
-          .subquery()
+        select(EventEmployers.id_event)
+          .where(EventEmployers.id_employee == employee_id)
     )
 
     query = (
         q
-        .filter(
+        .where(
           or_(
               Events.id_owner == employee_id,
               Events.id_event.in_(subq)
@@ -194,84 +211,215 @@ def list_my_events(
         )
     )
 
-    total = query.count()
-    events = (
+    total = await db.scalar(select(func.count()).select_from(query.subquery()))
+    events = (await db.scalars(
         query
         .order_by(Events.date.desc())
         .offset(skip)
         .limit(limit)
-        .all()
+    )).all()
+
+    result = await build_event_reads(db, events)
+
+    return PaginatedEvents(
+        total_count=total,
+        total_pages=ceil(total/limit),
+        skip=skip,
+        limit=limit,
+        events=result
     )
 
-    result: List[EventRead] = []
-    for ev in events:
-        employer_objs = (
-            db.query(Employers)
-              .join(EventEmployers, EventEmployers.id_employee == Employers.id_employee)
-              .filter(EventEmployers.id_event == ev.id_event)
-              .all()
+
+async def build_event_reads(db: AsyncSession, events: Sequence[Events]) -> List[EventRead]:
+    """
+    Участники и организаторы всей страницы мероприятий — двумя IN-запросами, а не по запросу на мероприятие.
+    Участников отдаётся не больше EVENT_ATTENDEES_PREVIEW на мероприятие (полный список — list_attendees),
+    общее число — из счётчика attendee_count.
+    """
+    if not events:
+        return []
+    event_ids = [ev.id_event for ev in events]
+    # LATERAL + LIMIT: на мероприятие читается не больше EVENT_ATTENDEES_PREVIEW строк первичного ключа
+    targets = select(Events.id_event).where(Events.id_event.in_(event_ids)).subquery()
+    preview = (
+        select(Employers.id_employee, Employers.first_name, Employers.last_name)
+        .join(EventEmployers, EventEmployers.id_employee == Employers.id_employee)
+        .where(EventEmployers.id_event == targets.c.id_event)
+        .order_by(EventEmployers.id_employee)
+        .limit(settings.EVENT_ATTENDEES_PREVIEW)
+        .lateral()
+    )
+    attendee_rows = (await db.execute(
+        select(targets.c.id_event, preview.c.id_employee, preview.c.first_name, preview.c.last_name)
+        .select_from(targets)
+        .join(preview, true())
+    )).all()
+    attendees = defaultdict(list)
+    for event_id, employee_id, first_name, last_name in attendee_rows:
+        attendees[event_id].append(
+            EmployeeSummary(id_employee=employee_id, first_name=first_name, last_name=last_name)
         )
-        attendees_summaries = [EmployeeSummary.from_orm(emp) for emp in employer_objs]
 
-        event_type_obj = db.query(EventTypes).filter_by(id_event_type=ev.id_event_type).first()
-        if not event_type_obj:
-            raise HTTPException(status_code=404, detail="Тип события не найден")
-        event_type_summary = EventTypeRead.from_orm(event_type_obj)
+    owner_ids = {ev.id_owner for ev in events}
+    owners = {
+        emp.id_employee: EmployeeSummary.from_orm(emp)
+        for emp in (await db.scalars(select(Employers).where(Employers.id_employee.in_(owner_ids)))).all()
+    }
 
-        owner_obj = db.query(Employers).filter_by(id_employee=ev.id_owner).first()
-        if not owner_obj:
+    result: List[EventRead] = []
+    for ev in events:
+        event_type = await reference_cache.alookup(db, "event_types", ev.id_event_type)
+        if not event_type:
+            raise HTTPException(status_code=404, detail="Тип события не найден")
+        owner_summary = owners.get(ev.id_owner)
+        if not owner_summary:
             raise HTTPException(status_code=404, detail="Организатор не найден")
-        owner_summary = EmployeeSummary.from_orm(owner_obj)
-
         result.append(
             EventRead.from_orm(
                 ev,
-                attendees=attendees_summaries,
-                event_type_summary=event_type_summary,
+                attendees=attendees[ev.id_event],
+                event_type_summary=EventTypeRead(**event_type),
                 owner_summary=owner_summary
             )
         )
-
-    return PaginatedEvents(
-        total_count=total,
-        total_pages=ceil(total/limit),
-        skip=skip,
-        limit=limit,
-        events=result
-    )
-
-
-def join_event(db: Session, event_id: UUID, employee_id: UUID):
-    # Проверим, что событие существует
-    event = db.query(Events).filter_by(id_event=event_id).first()
-    if not event:
+    return result
+
+
+def _decode_attendee_cursor(cursor: str) -> UUID:
+    try:
+        return UUID(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректный cursor")
+
+
+async def list_attendees(
+    db: AsyncSession,
+    event_id: UUID,
+    limit: int,
+    cursor: Optional[str] = None,
+    search: Optional[str] = None,
+) -> AttendeePage:
+    """
+    Участники мероприятия с keyset-пагинацией по id_employee: страница читается по первичному ключу
+    (id_event, id_employee), поэтому её стоимость не зависит от размера мероприятия.
+    """
+    if not await db.get(Events, event_id):
         raise HTTPException(status_code=404, detail="Мероприятие не найдено")
 
-    exists = db.query(EventEmployers).filter_by(
-        id_event=event_id, id_employee=employee_id
-    ).first()
-    if exists:
+    query = (
+        select(Employers.id_employee, Employers.first_name, Employers.last_name)
+        .join(EventEmployers, EventEmployers.id_employee == Employers.id_employee)
+        .where(EventEmployers.id_event == event_id)
+    )
+    if search:
+        pattern = f"%{search.lower()}%"
+        query = query.where(or_(Employers.last_name.ilike(pattern), Employers.first_name.ilike(pattern)))
+    if cursor:
+        query = query.where(EventEmployers.id_employee > _decode_attendee_cursor(cursor))
+    rows = (await db.execute(query.order_by(EventEmployers.id_employee).limit(limit + 1))).all()
+
+    items = [
+        EmployeeSummary(id_employee=employee_id, first_name=first_name, last_name=last_name)
+        for employee_id, first_name, last_name in rows[:limit]
+    ]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = str(last.id_employee)
+    return AttendeePage(items=items, next_cursor=next_cursor)
+
+
+def encode_calendar_cursor(day: date, event_id: UUID) -> str:
+    return base64.urlsafe_b64encode(f"{day.isoformat()}|{event_id}".encode()).decode()
+
+
+def decode_calendar_cursor(cursor: str) -> Tuple[date, UUID]:
+    try:
+        day, event_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return date.fromisoformat(day), UUID(event_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Некорректный cursor")
+
+
+def agenda_event_ids(employee_id: UUID, date_from: Optional[date] = None, date_to: Optional[date] = None):
+    """
+    id мероприятий сотрудника (организатор или участник) в диапазоне дат.
+    Две ветки UNION вместо OR — каждая идёт по своему индексу (ix_events_owner_date, ix_event_employers_employee).
+    """
+    owned = select(Events.id_event).where(Events.id_owner == employee_id)
+    attending = (
+        select(EventEmployers.id_event)
+        .join(Events, Events.id_event == EventEmployers.id_event)
+        .where(EventEmployers.id_employee == employee_id)
+    )
+    if date_from is not None:
+        owned = owned.where(Events.date >= date_from)
+        attending = attending.where(Events.date >= date_from)
+    if date_to is not None:
+        owned = owned.where(Events.date <= date_to)
+        attending = attending.where(Events.date <= date_to)
+    return union(owned, attending)
+
+
+async def list_calendar(
+    db: AsyncSession,
+    date_from: Optional[date],
+    date_to: Optional[date],
+    limit: int,
+    cursor: Optional[str] = None,
+    employee_id: Optional[UUID] = None,
+) -> CalendarEvents:
+    """
+    Мероприятия в диапазоне дат по возрастанию (date, id_event) с keyset-пагинацией по ix_events_date.
+    С employee_id — только повестка сотрудника.
+    """
+    query = select(Events)
+    if date_from is not None:
+        query = query.where(Events.date >= date_from)
+    if date_to is not None:
+        query = query.where(Events.date <= date_to)
+    if employee_id is not None:
+        query = query.where(Events.id_event.in_(agenda_event_ids(employee_id, date_from, date_to)))
+    if cursor:
+        query = query.where(tuple_(Events.date, Events.id_event) > decode_calendar_cursor(cursor))
+
+    events = (await db.scalars(
+        query
+        .order_by(Events.date, Events.id_event)
+        .limit(limit + 1)
+    )).all()
+
+    next_cursor = None
+    if len(events) > limit:
+        events = events[:limit]
+        next_cursor = encode_calendar_cursor(events[-1].date, events[-1].id_event)
+    return CalendarEvents(events=await build_event_reads(db, events), next_cursor=next_cursor)
+
+
+async def join_event(db: AsyncSession, event_id: UUID, employee_id: UUID):
+    joined = (await db.execute(attach_attendees_statement(event_id, [employee_id]))).first()
+    if not joined:
+        if not await db.get(Events, event_id):
+            raise HTTPException(status_code=404, detail="Мероприятие не найдено")
         raise HTTPException(status_code=400, detail="Вы уже участвуете в этом мероприятии")
 
-    link = EventEmployers(id_event=event_id, id_employee=employee_id)
-    db.add(link)
-
-    create_notification(db, f"Вы добавлены на мероприятие: {event.name_event}", [employee_id])
+    name_event, _ = joined
+    await enqueue_notification(db, f"Вы добавлены на мероприятие: {name_event}", [employee_id])
 
 
-def leave_event(db: Session, event_id: UUID, employee_id: UUID):
-    link = db.query(EventEmployers).filter_by(
-        id_event=event_id, id_employee=employee_id
-    ).first()
-    if not link:
+async def leave_event(db: AsyncSession, event_id: UUID, employee_id: UUID):
+    left = (await db.execute(detach_attendees_statement(
+        EventEmployers.id_event == event_id,
+        EventEmployers.id_employee == employee_id,
+    ))).first()
+    if not left:
         raise HTTPException(status_code=400, detail="Вы не участвуете в этом мероприятии")
-    db.delete(link)
 
 
-def update_event(
-    db: Session, event_id: UUID, event_in: EventUpdate, current_user_id: UUID
+async def update_event(
+    db: AsyncSession, event_id: UUID, event_in: EventUpdate, current_user_id: UUID
 ) -> Events:
-    event = db.query(Events).filter_by(id_event=event_id).first()
+    event = await db.get(Events, event_id)
     if not event:
         raise HTTPException(status_code=404, detail="Мероприятие не найдено")
 
@@ -284,19 +432,20 @@ def update_event(
     event.place = event_in.place.strip()
     event.id_event_type = event_in.id_event_type
 
-    db.flush()
+    await db.flush()
     return event
 
 
-def delete_event(db: Session, event_id: UUID, current_user_id: UUID):
-    event = db.query(Events).filter_by(id_event=event_id).first()
+async def delete_event(db: AsyncSession, event_id: UUID, current_user_id: UUID):
+    event = await db.get(Events, event_id)
     if not event:
         raise HTTPException(status_code=404, detail="Мероприятие не найдено")
 
     if event.id_owner != current_user_id:
         raise HTTPException(status_code=403, detail="Нет прав для удаления этого мероприятия")
 
-    # Сначала удалим связи
-    db.query(EventEmployers).filter_by(id_event=event_id).delete()
+    # Сначала удалим связи и счётчики для рекомендаций
+    await db.execute(delete(EventEmployers).where(EventEmployers.id_event == event_id))
+    await db.execute(delete(EventGroupAttendance).where(EventGroupAttendance.id_event == event_id))
     # Затем само мероприятие
-    db.delete(event)
+    await db.delete(event)
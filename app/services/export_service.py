@@ -0,0 +1,207 @@
+import csv
+import io
+import json
+from typing import Any, Dict, Iterator
+
+from sqlalchemy import select, func, literal_column
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.models import (
+    Employers, Positions, Departments,
+    Interests, InterestsEmployers,
+    Technologies, TechnologyEmployee, Ranks,
+    Projects, ProjectsEmployers, Roles,
+)
+
+CSV_COLUMNS = (
+    "id_employee",
+    "last_name",
+    "first_name",
+    "middle_name",
+    "date_of_birth",
+    "email",
+    "phone_number",
+    "telegram_name",
+    "city",
+    "position",
+    "department",
+    "interests",
+    "technologies",
+    "projects",
+)
+
+
+def _json_list(subquery_column):
+    return func.coalesce(subquery_column, literal_column("'[]'::json"))
+
+
+def build_directory_query():
+    """
+    Один SELECT на весь справочник: связи сотрудника агрегируются в JSON на стороне Postgres,
+    поэтому на сотрудника не выполняется ни одного дополнительного запроса.
+    """
+    interests = (
+        select(
+            InterestsEmployers.id_employee,
+            func.json_agg(aggregate_order_by(
+                func.json_build_object(
+                    "id_interest", Interests.id_interest,
+                    "name_interest", Interests.name_interest,
+                ),
+                Interests.name_interest,
+            )).label("agg"),
+        )
+        .join(Interests, Interests.id_interest == InterestsEmployers.id_interest)
+        .group_by(InterestsEmployers.id_employee)
+        .subquery()
+    )
+    technologies = (
+        select(
+            TechnologyEmployee.id_employee,
+            func.json_agg(aggregate_order_by(
+                func.json_build_object(
+                    "id_technology", Technologies.id_technology,
+                    "name_technology", Technologies.name_technology,
+                    "rank", func.json_build_object(
+                        "id_rank", Ranks.id_rank,
+                        "name_rank", Ranks.name_rank,
+                    ),
+                ),
+                Technologies.name_technology,
+            )).label("agg"),
+        )
+        .join(Technologies, Technologies.id_technology == TechnologyEmployee.id_technology)
+        .join(Ranks, Ranks.id_rank == TechnologyEmployee.id_rank)
+        .group_by(TechnologyEmployee.id_employee)
+        .subquery()
+    )
+    projects = (
+        select(
+            ProjectsEmployers.id_employee,
+            func.json_agg(aggregate_order_by(
+                func.json_build_object(
+                    "id_project", Projects.id_project,
+                    "name_project", Projects.name_project,
+                    "role", func.json_build_object(
+                        "id_role", Roles.id_role,
+                        "name_role", Roles.name_role,
+                    ),
+                ),
+                Projects.name_project,
+            )).label("agg"),
+        )
+        .join(Projects, Projects.id_project == ProjectsEmployers.id_project)
+        .join(Roles, Roles.id_role == ProjectsEmployers.id_role)
+        .group_by(ProjectsEmployers.id_employee)
+        .subquery()
+    )
+
+    return (
+        select(
+            Employers.id_employee,
+            Employers.first_name,
+            Employers.last_name,
+            Employers.middle_name,
+            Employers.date_of_birth,
+            Employers.email,
+            Employers.phone_number,
+            Employers.telegram_name,
+            Employers.city,
+            Positions.id_position,
+            Positions.position_name,
+            Departments.id_department,
+            Departments.name_department,
+            _json_list(interests.c.agg).label("interests"),
+            _json_list(technologies.c.agg).label("technologies"),
+            _json_list(projects.c.agg).label("projects"),
+        )
+        .outerjoin(Positions, Positions.id_position == Employers.id_position)
+        .outerjoin(Departments, Departments.id_department == Employers.id_department)
+        .outerjoin(interests, interests.c.id_employee == Employers.id_employee)
+        .outerjoin(technologies, technologies.c.id_employee == Employers.id_employee)
+        .outerjoin(projects, projects.c.id_employee == Employers.id_employee)
+        .order_by(Employers.last_name, Employers.first_name, Employers.id_employee)
+    )
+
+
+def _employee_record(row) -> Dict[str, Any]:
+    return {
+        "id_employee": row.id_employee,
+        "first_name": row.first_name,
+        "last_name": row.last_name,
+        "middle_name": row.middle_name,
+        "date_of_birth": row.date_of_birth,
+        "email": row.email,
+        "phone_number": row.phone_number,
+        "telegram_name": row.telegram_name,
+        "city": row.city,
+        "position": {
+            "id_position": row.id_position,
+            "position_name": row.position_name,
+        } if row.id_position else None,
+        "department": {
+            "id_department": row.id_department,
+            "name_department": row.name_department,
+        } if row.id_department else None,
+        "interests": row.interests,
+        "technologies": row.technologies,
+        "projects": row.projects,
+    }
+
+
+def _csv_values(row) -> list:
+    return [
+        row.id_employee,
+        row.last_name,
+        row.first_name,
+        row.middle_name,
+        row.date_of_birth,
+        row.email,
+        row.phone_number,
+        row.telegram_name,
+        row.city,
+        row.position_name,
+        row.name_department,
+        "; ".join(i["name_interest"] for i in row.interests),
+        "; ".join(f"{t['name_technology']} ({t['rank']['name_rank']})" for t in row.technologies),
+        "; ".join(f"{p['name_project']} ({p['role']['name_role']})" for p in row.projects),
+    ]
+
+
+def stream_directory(fmt: str) -> Iterator[str]:
+    """
+    Генератор выгрузки справочника сотрудников в CSV или NDJSON.
+
+    Строки читаются через серверный курсор пачками по EXPORT_BATCH_SIZE,
+    каждая пачка сериализуется и отдаётся клиенту целиком, так что память не зависит от числа сотрудников.
+    Сессия открывается внутри генератора, потому что он выполняется уже после выхода из обработчика.
+    """
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            build_directory_query().execution_options(yield_per=settings.EXPORT_BATCH_SIZE)
+        )
+
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            # BOM — чтобы Excel сразу открыл файл в UTF-8
+            buffer.write("\ufeff")
+            writer.writerow(CSV_COLUMNS)
+            for partition in result.partitions():
+                writer.writerows(_csv_values(row) for row in partition)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue()
+        else:
+            for partition in result.partitions():
+                yield "".join(
+                    json.dumps(_employee_record(row), ensure_ascii=False, default=str) + "\n"
+                    for row in partition
+                )
+    finally:
+        db.close()
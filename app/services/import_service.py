@@ -0,0 +1,279 @@
+import codecs
+import csv
+import json
+import uuid
+from itertools import chain
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from uuid import UUID
+
+from pydantic import ValidationError
+from sqlalchemy import insert, update, or_
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.models import Employers, Events
+from app.schemas.schemas import EmployeeImportRow
+from app.services.city_service import apply_city_changes
+from app.services.recommendation_service import shift_group_membership
+from app.services.reference_cache import reference_cache
+from app.services.user_service import delete_employees
+
+EMPLOYEE_FIELDS = (
+    "first_name",
+    "last_name",
+    "middle_name",
+    "date_of_birth",
+    "email",
+    "phone_number",
+    "telegram_name",
+    "city",
+    "id_position",
+    "id_department",
+)
+UNIQUE_FIELDS = ("email", "phone_number", "telegram_name")
+
+
+def detect_format(filename: Optional[str], content_type: Optional[str]) -> str:
+    name = (filename or "").lower()
+    if name.endswith((".ndjson", ".jsonl")) or content_type in ("application/x-ndjson", "application/jsonl"):
+        return "ndjson"
+    return "csv"
+
+
+def iter_rows(stream: BinaryIO, fmt: str) -> Iterator[Tuple[int, Optional[Dict[str, Any]]]]:
+    """
+    Построчно читает загруженный файл, не загружая его целиком в память.
+    Возвращает пары (номер строки данных, словарь полей); для нераспознанной строки — None.
+    """
+    lines = codecs.iterdecode(stream, "utf-8-sig")
+
+    if fmt == "csv":
+        for row_no, row in enumerate(csv.DictReader(lines), start=1):
+            yield row_no, {key.strip(): value for key, value in row.items() if key}
+        return
+
+    row_no = 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        row_no += 1
+        try:
+            data = json.loads(line)
+        except ValueError:
+            data = None
+        yield row_no, data if isinstance(data, dict) else None
+
+
+def _chunks(rows: Iterable, size: int) -> Iterator[List]:
+    chunk = []
+    for item in rows:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _validation_messages(exc: ValidationError) -> List[str]:
+    return [
+        f"{'.'.join(str(part) for part in err['loc']) or 'row'}: {err['msg']}"
+        for err in exc.errors()
+    ]
+
+
+def import_employees(
+        db: Session,
+        stream: BinaryIO,
+        fmt: str,
+        *,
+        reconcile: bool = False,
+        delete_missing: bool = False,
+        protected_ids: Iterable[UUID] = (),
+) -> Dict[str, Any]:
+    """
+    Массовая загрузка сотрудников из CSV/NDJSON.
+
+    Файл читается потоково и обрабатывается пачками по IMPORT_CHUNK_SIZE строк:
+    уникальность email/телефона/telegram проверяется одним запросом на пачку,
+    запись идёт пакетными INSERT/UPDATE с коммитом на пачку.
+    В режиме reconcile существующие сотрудники (по id_employee, иначе по email) обновляются,
+    а при delete_missing удаляются те, кого нет в файле — только если в файле не было ошибок.
+    Сотрудники из protected_ids (текущий пользователь) и организаторы мероприятий не удаляются:
+    вторые, как и ошибки БД при удалении, попадают в delete_errors.
+    """
+    position_ids = reference_cache.get(db, "positions").by_id
+    department_ids = reference_cache.get(db, "departments").by_id
+
+    result: Dict[str, Any] = {
+        "created": 0,
+        "updated": 0,
+        "unchanged": 0,
+        "deleted": 0,
+        "delete_skipped": False,
+        "errors": [],
+        "delete_errors": [],
+    }
+    errors: List[Dict[str, Any]] = result["errors"]
+    delete_errors: List[Dict[str, Any]] = result["delete_errors"]
+    seen_values: Dict[str, Set[str]] = {field: set() for field in UNIQUE_FIELDS}
+    seen_ids: Set[UUID] = set()
+    kept_ids: Set[UUID] = set()
+
+    for chunk in _chunks(iter_rows(stream, fmt), settings.IMPORT_CHUNK_SIZE):
+        valid: List[Tuple[int, EmployeeImportRow]] = []
+
+        for row_no, raw in chunk:
+            if raw is None:
+                errors.append({"row": row_no, "errors": ["Не удалось разобрать строку"]})
+                continue
+            try:
+                row = EmployeeImportRow.model_validate(raw)
+            except ValidationError as exc:
+                errors.append({"row": row_no, "errors": _validation_messages(exc)})
+                continue
+
+            problems = []
+            if row.id_position not in position_ids:
+                problems.append(f"id_position: должность {row.id_position} не найдена")
+            if row.id_department not in department_ids:
+                problems.append(f"id_department: отдел {row.id_department} не найден")
+            for field in UNIQUE_FIELDS:
+                value = getattr(row, field)
+                if value in seen_values[field]:
+                    problems.append(f"{field}: значение {value} повторяется в файле")
+                seen_values[field].add(value)
+            if row.id_employee:
+                if row.id_employee in seen_ids:
+                    problems.append(f"id_employee: сотрудник {row.id_employee} повторяется в файле")
+                seen_ids.add(row.id_employee)
+
+            if problems:
+                errors.append({"row": row_no, "errors": problems})
+            else:
+                valid.append((row_no, row))
+
+        if not valid:
+            continue
+
+        ids = [row.id_employee for _, row in valid if row.id_employee]
+        existing = (
+            db.query(Employers)
+                .filter(or_(
+                    Employers.id_employee.in_(ids),
+                    Employers.email.in_([row.email for _, row in valid]),
+                    Employers.phone_number.in_([row.phone_number for _, row in valid]),
+                    Employers.telegram_name.in_([row.telegram_name for _, row in valid]),
+                ))
+                .all()
+        )
+        by_id = {emp.id_employee: emp for emp in existing}
+        by_field = {
+            field: {getattr(emp, field): emp for emp in existing}
+            for field in UNIQUE_FIELDS
+        }
+
+        inserts: List[Dict[str, Any]] = []
+        updates: List[Dict[str, Any]] = []
+        replaced_cities: List[str] = []
+        left_departments: List[Tuple[UUID, str, UUID]] = []
+        joined_departments: List[Tuple[UUID, str, UUID]] = []
+        written_rows: List[int] = []
+        unchanged_ids: List[UUID] = []
+
+        for row_no, row in valid:
+            if row.id_employee:
+                target = by_id.get(row.id_employee)
+            else:
+                target = by_field["email"].get(row.email) if reconcile else None
+
+            if target is not None and not reconcile:
+                errors.append({"row": row_no, "errors": [f"Сотрудник {target.id_employee} уже существует"]})
+                continue
+
+            conflicts = [
+                field for field in UNIQUE_FIELDS
+                if (other := by_field[field].get(getattr(row, field))) is not None
+                and (target is None or other.id_employee != target.id_employee)
+            ]
+            if conflicts:
+                errors.append({"row": row_no, "errors": [f"{conflicts} already in use"]})
+                continue
+
+            data = row.model_dump(include=set(EMPLOYEE_FIELDS))
+            if target is None:
+                inserts.append({"id_employee": row.id_employee or uuid.uuid4(), **data})
+                written_rows.append(row_no)
+            elif any(getattr(target, field) != value for field, value in data.items()):
+                updates.append({"id_employee": target.id_employee, **data})
+                replaced_cities.append(target.city)
+                if target.id_department != data["id_department"]:
+                    if target.id_department is not None:
+                        left_departments.append((target.id_employee, "department", target.id_department))
+                    if data["id_department"] is not None:
+                        joined_departments.append((target.id_employee, "department", data["id_department"]))
+                written_rows.append(row_no)
+            else:
+                unchanged_ids.append(target.id_employee)
+
+        try:
+            if inserts:
+                db.execute(insert(Employers), inserts)
+            if updates:
+                db.execute(update(Employers), updates)
+            if left_departments:
+                db.execute(shift_group_membership(left_departments, -1))
+            if joined_departments:
+                db.execute(shift_group_membership(joined_departments, 1))
+            apply_city_changes(
+                db,
+                removed=replaced_cities,
+                added=[item["city"] for item in chain(inserts, updates)]
+            )
+            db.commit()
+        except SQLAlchemyError as exc:
+            db.rollback()
+            message = f"Ошибка записи в БД: {exc.__class__.__name__}"
+            errors.extend({"row": row_no, "errors": [message]} for row_no in written_rows)
+            inserts, updates = [], []
+
+        result["created"] += len(inserts)
+        result["updated"] += len(updates)
+        result["unchanged"] += len(unchanged_ids)
+        kept_ids.update(item["id_employee"] for item in inserts)
+        kept_ids.update(item["id_employee"] for item in updates)
+        kept_ids.update(unchanged_ids)
+        db.expunge_all()
+
+    if reconcile and delete_missing:
+        if errors:
+            result["delete_skipped"] = True
+        else:
+            kept_ids.update(protected_ids)
+            missing = [
+                emp_id for (emp_id,) in db.query(Employers.id_employee).yield_per(settings.IMPORT_CHUNK_SIZE)
+                if emp_id not in kept_ids
+            ]
+            for batch in _chunks(missing, settings.IMPORT_CHUNK_SIZE):
+                # на сотрудника ссылаются его мероприятия: удаление нарушило бы внешний ключ events.id_owner
+                owners = {
+                    owner_id for (owner_id,) in
+                    db.query(Events.id_owner).filter(Events.id_owner.in_(batch)).distinct()
+                }
+                delete_errors.extend(
+                    {"id_employee": emp_id, "errors": ["Сотрудник является организатором мероприятий"]}
+                    for emp_id in batch if emp_id in owners
+                )
+                batch = [emp_id for emp_id in batch if emp_id not in owners]
+                try:
+                    result["deleted"] += delete_employees(db, batch)
+                    db.commit()
+                except SQLAlchemyError as exc:
+                    db.rollback()
+                    message = f"Ошибка удаления из БД: {exc.__class__.__name__}"
+                    delete_errors.extend({"id_employee": emp_id, "errors": [message]} for emp_id in batch)
+
+    errors.sort(key=lambda err: err["row"])
+    return result
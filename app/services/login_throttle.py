@@ -0,0 +1,166 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, NamedTuple, Optional
+
+from fastapi import HTTPException, Request
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.models import LoginThrottle
+
+
+class ThrottleEntry(NamedTuple):
+    window: int
+    current: int
+    previous: int
+    banned_until: float
+
+
+EMPTY_ENTRY = ThrottleEntry(0, 0, 0, 0.0)
+
+
+class MemoryThrottleBackend:
+    """Ограниченный LRU-словарь в памяти процесса; самые давние ключи вытесняются."""
+
+    def __init__(self, max_keys: int):
+        self._max_keys = max_keys
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, ThrottleEntry]" = OrderedDict()
+
+    def get(self, db: Session, key: str) -> Optional[ThrottleEntry]:
+        return self._entries.get(key)
+
+    def update(self, db: Session, key: str, fn: Callable[[ThrottleEntry], ThrottleEntry]):
+        with self._lock:
+            self._entries[key] = fn(self._entries.get(key, EMPTY_ENTRY))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_keys:
+                self._entries.popitem(last=False)
+
+    def delete(self, db: Session, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class DatabaseThrottleBackend:
+    """Таблица login_throttle — общая для всех воркеров; устаревшие строки удаляются при записи."""
+
+    def get(self, db: Session, key: str) -> Optional[ThrottleEntry]:
+        row = db.query(LoginThrottle).filter(LoginThrottle.key == key).first()
+        return self._to_entry(row) if row else None
+
+    def update(self, db: Session, key: str, fn: Callable[[ThrottleEntry], ThrottleEntry]):
+        row = db.query(LoginThrottle).filter(LoginThrottle.key == key).with_for_update().first()
+        entry = fn(self._to_entry(row) if row else EMPTY_ENTRY)
+        values = {
+            "window": entry.window,
+            "current": entry.current,
+            "previous": entry.previous,
+            "banned_until": datetime.utcfromtimestamp(entry.banned_until),
+            "updated_at": datetime.utcnow(),
+        }
+        # upsert, а не merge: для нового ключа FOR UPDATE ничего не блокирует
+        db.execute(
+            insert(LoginThrottle)
+                .values(key=key, **values)
+                .on_conflict_do_update(index_elements=[LoginThrottle.key], set_=values)
+        )
+        horizon = time.time() - 2 * settings.LOGIN_WINDOW_SECONDS - settings.BAN_DURATION_MINUTES * 60
+        db.query(LoginThrottle).filter(
+            LoginThrottle.updated_at < datetime.utcfromtimestamp(horizon)
+        ).delete(synchronize_session=False)
+        db.commit()
+
+    def delete(self, db: Session, key: str):
+        db.query(LoginThrottle).filter(LoginThrottle.key == key).delete(synchronize_session=False)
+        db.commit()
+
+    @staticmethod
+    def _to_entry(row: LoginThrottle) -> ThrottleEntry:
+        banned_until = (row.banned_until - datetime(1970, 1, 1)).total_seconds() if row.banned_until else 0.0
+        return ThrottleEntry(row.window, row.current, row.previous, banned_until)
+
+
+def _rolled(entry: ThrottleEntry, window: int) -> ThrottleEntry:
+    if entry.window == window:
+        return entry
+    if entry.window == window - 1:
+        return ThrottleEntry(window, 0, entry.current, entry.banned_until)
+    return ThrottleEntry(window, 0, 0, entry.banned_until)
+
+
+class LoginThrottler:
+    """
+    Ограничение попыток входа скользящим окном (два соседних фиксированных окна с весом),
+    отдельно по имени пользователя и по IP клиента. Проверка — O(1) и не трогает Users и bcrypt.
+
+    По имени пользователя: MAX_FAILED_ATTEMPTS неудач за окно — бан на BAN_DURATION_MINUTES.
+    По IP: больше LOGIN_IP_MAX_FAILURES неудач за окно — 429 до конца окна.
+    """
+
+    def __init__(self, backend, window_seconds: int):
+        self._backend = backend
+        self._window = window_seconds
+
+    def _estimate(self, entry: Optional[ThrottleEntry], now: float) -> float:
+        if entry is None:
+            return 0
+        entry = _rolled(entry, int(now // self._window))
+        weight = 1 - (now % self._window) / self._window
+        return entry.current + entry.previous * weight
+
+    def check(self, db: Session, username: str, ip: str):
+        now = time.time()
+
+        user_entry = self._backend.get(db, f"user:{username}")
+        if user_entry and user_entry.banned_until > now:
+            raise HTTPException(status_code=403, detail="User is banned. Try again later.")
+
+        ip_entry = self._backend.get(db, f"ip:{ip}")
+        if self._estimate(ip_entry, now) >= settings.LOGIN_IP_MAX_FAILURES:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many login attempts. Try again later.",
+                headers={"Retry-After": str(int(self._window - now % self._window) + 1)}
+            )
+
+    def record_failure(self, db: Session, username: Optional[str], ip: str):
+        now = time.time()
+        window = int(now // self._window)
+
+        def bump(limit: Optional[int]):
+            def apply(entry: ThrottleEntry) -> ThrottleEntry:
+                entry = _rolled(entry, window)
+                entry = entry._replace(current=entry.current + 1)
+                if limit and self._estimate(entry, now) >= limit:
+                    # после бана счёт начинается заново, как и раньше
+                    entry = ThrottleEntry(window, 0, 0, now + settings.BAN_DURATION_MINUTES * 60)
+                return entry
+            return apply
+
+        self._backend.update(db, f"ip:{ip}", bump(None))
+        if username:
+            self._backend.update(db, f"user:{username}", bump(settings.MAX_FAILED_ATTEMPTS))
+
+    def reset(self, db: Session, username: str):
+        self._backend.delete(db, f"user:{username}")
+
+
+def client_ip(request: Request) -> str:
+    if settings.TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def _create_backend():
+    if settings.LOGIN_THROTTLE_BACKEND == "database":
+        return DatabaseThrottleBackend()
+    return MemoryThrottleBackend(settings.LOGIN_THROTTLE_MAX_KEYS)
+
+
+login_throttler = LoginThrottler(_create_backend(), settings.LOGIN_WINDOW_SECONDS)
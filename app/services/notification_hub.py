@@ -0,0 +1,170 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import time
+import traceback
+from collections import defaultdict
+from typing import Dict, List, Set, Tuple
+from uuid import UUID
+
+import asyncpg
+from fastapi import HTTPException
+from sqlalchemy import select, any_, bindparam
+from sqlalchemy.dialects.postgresql import ARRAY, UUID as PG_UUID
+
+from app.core.config import settings
+from app.core.database import DATABASE_URL, AsyncSessionLocal
+from app.models.models import Notifications, NotificationsEmployees
+from app.services.notification_service import audience_members
+
+LISTEN_RECONNECT_SECONDS = 5
+
+
+class NotificationHub:
+    """
+    Процессный pub/sub: employee_id -> очереди открытых SSE-подключений этого воркера.
+
+    Источник событий — LISTEN на канале NOTIFICATION_PUSH_CHANNEL: воркер доставки outbox
+    делает pg_notify(id уведомления) в той же транзакции, что и вставку получателей
+    (рассылка — в транзакции создания), поэтому событие получают все воркеры, а не только тот, где прошла доставка.
+    """
+
+    def __init__(self, queue_size: int):
+        self._queue_size = queue_size
+        self._subscribers: Dict[UUID, Set[asyncio.Queue]] = defaultdict(set)
+        self.dropped = 0
+
+    def subscribe(self, employee_id: UUID) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self._queue_size)
+        self._subscribers[employee_id].add(queue)
+        return queue
+
+    def unsubscribe(self, employee_id: UUID, queue: asyncio.Queue):
+        queues = self._subscribers.get(employee_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[employee_id]
+
+    def publish(self, employee_id: UUID, message: Dict):
+        for queue in self._subscribers.get(employee_id, ()):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # медленный клиент догонит через GET /common/notifications
+                self.dropped += 1
+
+    def subscribed_ids(self) -> List[UUID]:
+        return list(self._subscribers)
+
+    async def dispatch(self, notification_id: UUID):
+        subscribed = self.subscribed_ids()
+        if not subscribed:
+            return
+        subscribed_param = bindparam("subscribed", subscribed, type_=ARRAY(PG_UUID(as_uuid=True)))
+        async with AsyncSessionLocal() as db:
+            notification = (await db.execute(
+                select(Notifications.content, Notifications.created_at, Notifications.audience, Notifications.audience_id)
+                    .where(Notifications.id == notification_id)
+            )).first()
+            if notification is None:
+                return
+            content, created_at, audience, audience_id = notification
+            if audience is None:
+                rows = (await db.execute(
+                    select(NotificationsEmployees.id_employee, NotificationsEmployees.is_shown)
+                        .where(
+                            NotificationsEmployees.id_notification == notification_id,
+                            NotificationsEmployees.id_employee == any_(subscribed_param),
+                        )
+                )).all()
+            else:
+                # рассылка: получатели — подписанные сотрудники этого воркера, входящие в аудиторию
+                members = audience_members(audience, audience_id).subquery()
+                rows = [
+                    (employee_id, False)
+                    for (employee_id,) in (await db.execute(
+                        select(members.c.id_employee).where(members.c.id_employee == any_(subscribed_param))
+                    )).all()
+                ]
+        for employee_id, is_shown in rows:
+            self.publish(employee_id, {
+                "id": str(notification_id),
+                "content": content,
+                "is_shown": is_shown,
+                "created_at": created_at.isoformat(),
+            })
+
+
+notification_hub = NotificationHub(settings.NOTIFICATION_STREAM_QUEUE_SIZE)
+
+
+async def run_notification_listener(hub: NotificationHub = notification_hub):
+    """Отдельное (не из пула) соединение asyncpg с LISTEN; при обрыве переподключается."""
+    loop = asyncio.get_running_loop()
+
+    def on_notify(connection, pid, channel, payload):
+        try:
+            notification_id = UUID(payload)
+        except ValueError:
+            return
+        loop.create_task(_dispatch_safely(hub, notification_id))
+
+    while True:
+        connection = None
+        try:
+            connection = await asyncpg.connect(DATABASE_URL)
+            await connection.add_listener(settings.NOTIFICATION_PUSH_CHANNEL, on_notify)
+            while not connection.is_closed():
+                await asyncio.sleep(LISTEN_RECONNECT_SECONDS)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            traceback.print_exc()
+        finally:
+            if connection is not None and not connection.is_closed():
+                await connection.close()
+        await asyncio.sleep(LISTEN_RECONNECT_SECONDS)
+
+
+async def _dispatch_safely(hub: NotificationHub, notification_id: UUID):
+    try:
+        await hub.dispatch(notification_id)
+    except Exception:
+        traceback.print_exc()
+
+
+def format_event(message: Dict) -> str:
+    return f"event: notification\ndata: {json.dumps(message, ensure_ascii=False)}\n\n"
+
+
+def _stream_signature(employee_id: UUID, jti: str, expires: int) -> str:
+    return hmac.new(
+        settings.SECRET_KEY.encode(), f"sse:{employee_id}:{jti}:{expires}".encode(), hashlib.sha256
+    ).hexdigest()[:32]
+
+
+def stream_token(employee_id: UUID, jti: str) -> str:
+    """
+    Короткоживущая подпись для подключения к SSE-потоку: EventSource в браузере не умеет
+    передавать заголовок Authorization. Содержит jti выпустившего её JWT, чтобы при открытии
+    соединения проверить, что сессия не отозвана.
+    """
+    expires = int(time.time()) + settings.NOTIFICATION_STREAM_TOKEN_SECONDS
+    return f"{employee_id}.{jti}.{expires}.{_stream_signature(employee_id, jti, expires)}"
+
+
+def check_stream_token(token: str) -> Tuple[UUID, str]:
+    """Проверяет подпись и срок; возвращает (employee_id, jti) — отзыв и существование сотрудника проверяет вызывающий."""
+    try:
+        raw_id, jti, raw_expires, signature = token.split(".")
+        employee_id, expires = UUID(raw_id), int(raw_expires)
+    except ValueError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    if not hmac.compare_digest(_stream_signature(employee_id, jti, expires), signature):
+        raise HTTPException(status_code=401, detail="Invalid token")
+    if expires < time.time():
+        raise HTTPException(status_code=401, detail="Token expired")
+    return employee_id, jti
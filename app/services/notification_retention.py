@@ -0,0 +1,164 @@
+import asyncio
+import traceback
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, delete, and_, or_, exists, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.models import Notifications, NotificationsEmployees, NotificationReads, NotificationOutbox
+
+
+def _cutoff(days: int, now: datetime):
+    return now - timedelta(days=days) if days > 0 else None
+
+
+async def purge_expired_recipients(db: AsyncSession, batch_size: int) -> int:
+    """
+    Удаляет одну пачку устаревших строк notifications_employees: прочитанные старше
+    NOTIFICATION_READ_RETENTION_DAYS, непрочитанные — старше NOTIFICATION_UNREAD_RETENTION_DAYS.
+    Строки, занятые другими транзакциями, пропускаются (SKIP LOCKED) и удаляются в следующий проход.
+    """
+    now = datetime.utcnow()
+    read_cutoff = _cutoff(settings.NOTIFICATION_READ_RETENTION_DAYS, now)
+    unread_cutoff = _cutoff(settings.NOTIFICATION_UNREAD_RETENTION_DAYS, now)
+    conditions = []
+    if read_cutoff is not None:
+        conditions.append(and_(NotificationsEmployees.is_shown.is_(True), NotificationsEmployees.created_at < read_cutoff))
+    if unread_cutoff is not None:
+        conditions.append(and_(NotificationsEmployees.is_shown.is_(False), NotificationsEmployees.created_at < unread_cutoff))
+    if not conditions:
+        return 0
+
+    batch = (
+        select(NotificationsEmployees.id_notification, NotificationsEmployees.id_employee)
+            .where(or_(*conditions))
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+    )
+    result = await db.execute(
+        delete(NotificationsEmployees)
+            .where(tuple_(NotificationsEmployees.id_notification, NotificationsEmployees.id_employee).in_(batch))
+            .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount
+
+
+async def purge_exhausted_outbox(db: AsyncSession, batch_size: int) -> int:
+    """
+    Удаляет одну пачку записей outbox, исчерпавших NOTIFICATION_OUTBOX_MAX_ATTEMPTS и старше
+    NOTIFICATION_OUTBOX_FAILED_RETENTION_DAYS: доставка по ним больше не повторяется,
+    а без записи уведомление уходит следующим шагом как осиротевшее.
+    """
+    cutoff = _cutoff(settings.NOTIFICATION_OUTBOX_FAILED_RETENTION_DAYS, datetime.utcnow())
+    if cutoff is None:
+        return 0
+
+    batch = (
+        select(NotificationOutbox.id)
+            .where(
+                NotificationOutbox.attempts >= settings.NOTIFICATION_OUTBOX_MAX_ATTEMPTS,
+                NotificationOutbox.created_at < cutoff,
+            )
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+    )
+    result = await db.execute(
+        delete(NotificationOutbox)
+            .where(NotificationOutbox.id.in_(batch))
+            .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount
+
+
+async def purge_orphan_notifications(db: AsyncSession, batch_size: int) -> int:
+    """
+    Удаляет одну пачку уведомлений, у которых не осталось получателей и нет записи в outbox.
+    Моложе минимального срока хранения не трогаем: их получатели могут быть ещё не разосланы.
+    """
+    days = [d for d in (settings.NOTIFICATION_READ_RETENTION_DAYS, settings.NOTIFICATION_UNREAD_RETENTION_DAYS) if d > 0]
+    if not days:
+        return 0
+    cutoff = datetime.utcnow() - timedelta(days=min(days))
+
+    batch = (
+        select(Notifications.id)
+            .where(
+                Notifications.audience.is_(None),
+                Notifications.created_at < cutoff,
+                ~exists().where(NotificationsEmployees.id_notification == Notifications.id),
+                ~exists().where(NotificationOutbox.id_notification == Notifications.id),
+            )
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+    )
+    result = await db.execute(
+        delete(Notifications)
+            .where(Notifications.id.in_(batch))
+            .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount
+
+
+async def purge_expired_broadcasts(db: AsyncSession, batch_size: int) -> int:
+    """
+    Удаляет одну пачку рассылок старше NOTIFICATION_UNREAD_RETENTION_DAYS вместе с отметками о прочтении.
+    Отметки отдельно не чистятся: без неё рассылка снова стала бы непрочитанной.
+    """
+    cutoff = _cutoff(settings.NOTIFICATION_UNREAD_RETENTION_DAYS, datetime.utcnow())
+    if cutoff is None:
+        return 0
+
+    expired = (await db.execute(
+        select(Notifications.id)
+            .where(Notifications.audience.isnot(None), Notifications.created_at < cutoff)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+    )).scalars().all()
+    if expired:
+        await db.execute(
+            delete(NotificationReads)
+                .where(NotificationReads.id_notification.in_(expired))
+                .execution_options(synchronize_session=False)
+        )
+        await db.execute(
+            delete(Notifications)
+                .where(Notifications.id.in_(expired))
+                .execution_options(synchronize_session=False)
+        )
+    await db.commit()
+    return len(expired)
+
+
+async def purge_notifications(batch_size: int) -> int:
+    """Полный проход очистки короткими транзакциями; между пачками отдаёт управление циклу событий."""
+    purged = 0
+    for step in (purge_expired_recipients, purge_exhausted_outbox, purge_orphan_notifications, purge_expired_broadcasts):
+        while True:
+            async with AsyncSessionLocal() as db:
+                deleted = await step(db, batch_size)
+            purged += deleted
+            if deleted < batch_size:
+                break
+            await asyncio.sleep(0)
+    return purged
+
+
+async def run_notification_purge():
+    """Фоновая очистка раз в NOTIFICATION_PURGE_INTERVAL_SECONDS."""
+    while True:
+        try:
+            await purge_notifications(settings.NOTIFICATION_PURGE_BATCH_SIZE)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            traceback.print_exc()
+        await asyncio.sleep(settings.NOTIFICATION_PURGE_INTERVAL_SECONDS)
+
+
+if __name__ == "__main__":
+    print(f"purged: {asyncio.run(purge_notifications(settings.NOTIFICATION_PURGE_BATCH_SIZE))}")
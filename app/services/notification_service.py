@@ -0,0 +1,334 @@
+import asyncio
+import base64
+import traceback
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from uuid import UUID, uuid4
+
+from fastapi import HTTPException
+from sqlalchemy import (
+    event, select, delete, update, literal, false, any_, bindparam, func, DateTime, tuple_, and_, or_, exists,
+    union_all
+)
+from sqlalchemy.dialects.postgresql import insert, ARRAY, UUID as PG_UUID
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.models import (
+    Employers, EventEmployers, ProjectsEmployers, Notifications, NotificationsEmployees, NotificationReads,
+    NotificationOutbox
+)
+
+_PENDING_KEY = "notification_outbox_pending"
+
+_wakeup: Optional[asyncio.Event] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+async def enqueue_notification(db: AsyncSession, content: str, employee_ids: Iterable[UUID]) -> UUID:
+    """
+    Записывает уведомление и запись outbox в транзакции вызывающего (без commit).
+
+    Получатели сохраняются одним массивом, поэтому стоимость запроса не зависит от их числа;
+    строки notifications_employees создаёт фоновый воркер после commit.
+    """
+    recipient_ids = list(dict.fromkeys(employee_ids))
+    notification_id = uuid4()
+    created_at = datetime.utcnow()
+    await db.execute(insert(Notifications).values(id=notification_id, content=content, created_at=created_at))
+    if recipient_ids:
+        await db.execute(insert(NotificationOutbox).values(
+            id=uuid4(),
+            id_notification=notification_id,
+            recipient_ids=recipient_ids,
+            created_at=created_at,
+            attempts=0,
+        ))
+        db.sync_session.info[_PENDING_KEY] = True
+    return notification_id
+
+
+def encode_cursor(created_at: datetime, notification_id: UUID) -> str:
+    raw = f"{created_at.isoformat()}|{notification_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    try:
+        created_at, notification_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), UUID(notification_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Некорректный cursor")
+
+
+async def broadcast_notification(
+        db: AsyncSession,
+        content: str,
+        audience: str,
+        audience_id: Optional[UUID] = None
+) -> UUID:
+    """
+    Рассылка на аудиторию одной строкой notifications (без commit): получатели не материализуются,
+    лента сотрудника подмешивает подходящие рассылки при чтении.
+    """
+    notification_id = uuid4()
+    await db.execute(insert(Notifications).values(
+        id=notification_id,
+        content=content,
+        created_at=datetime.utcnow(),
+        audience=audience,
+        audience_id=audience_id,
+    ))
+    if settings.NOTIFICATION_PUSH_ENABLED:
+        await db.execute(select(func.pg_notify(settings.NOTIFICATION_PUSH_CHANNEL, str(notification_id))))
+    return notification_id
+
+
+def audience_members(audience: str, audience_id: Optional[UUID]):
+    """SELECT id сотрудников аудитории рассылки."""
+    if audience == "department":
+        return select(Employers.id_employee).where(Employers.id_department == audience_id)
+    if audience == "project":
+        return select(ProjectsEmployers.id_employee).where(ProjectsEmployers.id_project == audience_id)
+    if audience == "event":
+        return select(EventEmployers.id_employee).where(EventEmployers.id_event == audience_id)
+    return select(Employers.id_employee)
+
+
+def _visible_broadcasts(employee_id: UUID):
+    department_id = select(Employers.id_department).where(Employers.id_employee == employee_id).scalar_subquery()
+    return and_(
+        Notifications.audience.isnot(None),
+        or_(
+            Notifications.audience == "all",
+            and_(Notifications.audience == "department", Notifications.audience_id == department_id),
+            and_(
+                Notifications.audience == "project",
+                Notifications.audience_id.in_(
+                    select(ProjectsEmployers.id_project).where(ProjectsEmployers.id_employee == employee_id)
+                )
+            ),
+            and_(
+                Notifications.audience == "event",
+                Notifications.audience_id.in_(
+                    select(EventEmployers.id_event).where(EventEmployers.id_employee == employee_id)
+                )
+            ),
+        )
+    )
+
+
+def _broadcast_read(employee_id: UUID):
+    return exists().where(
+        NotificationReads.id_notification == Notifications.id,
+        NotificationReads.id_employee == employee_id,
+    )
+
+
+async def list_notifications(
+        db: AsyncSession,
+        employee_id: UUID,
+        limit: int,
+        cursor: Optional[str] = None,
+        unread_only: bool = False
+) -> Dict:
+    """
+    Лента уведомлений от новых к старым, keyset-пагинация по (created_at, id).
+    Персональные и рассылки выбираются отдельно (каждая ветка — не больше limit + 1 строк по своему индексу)
+    и сливаются в один UNION ALL.
+    """
+    direct = (
+        select(
+            NotificationsEmployees.id_notification.label("id"),
+            Notifications.content,
+            NotificationsEmployees.is_shown,
+            NotificationsEmployees.created_at,
+        )
+            .join(Notifications, Notifications.id == NotificationsEmployees.id_notification)
+            .where(NotificationsEmployees.id_employee == employee_id)
+    )
+    broadcast = (
+        select(
+            Notifications.id,
+            Notifications.content,
+            _broadcast_read(employee_id).label("is_shown"),
+            Notifications.created_at,
+        )
+            .where(_visible_broadcasts(employee_id))
+    )
+    if unread_only:
+        direct = direct.where(NotificationsEmployees.is_shown.is_(False))
+        broadcast = broadcast.where(~_broadcast_read(employee_id))
+    if cursor:
+        position = decode_cursor(cursor)
+        direct = direct.where(
+            tuple_(NotificationsEmployees.created_at, NotificationsEmployees.id_notification) < position
+        )
+        broadcast = broadcast.where(tuple_(Notifications.created_at, Notifications.id) < position)
+    direct = direct.order_by(
+        NotificationsEmployees.created_at.desc(), NotificationsEmployees.id_notification.desc()
+    ).limit(limit + 1)
+    broadcast = broadcast.order_by(Notifications.created_at.desc(), Notifications.id.desc()).limit(limit + 1)
+
+    feed = union_all(direct.subquery().select(), broadcast.subquery().select()).subquery()
+    rows = (await db.execute(
+        select(feed.c.id, feed.c.content, feed.c.is_shown, feed.c.created_at)
+            .order_by(feed.c.created_at.desc(), feed.c.id.desc())
+            .limit(limit + 1)
+    )).all()
+
+    items = [
+        {"id": notification_id, "content": content, "is_shown": is_shown, "created_at": created_at}
+        for notification_id, content, is_shown, created_at in rows[:limit]
+    ]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(last["created_at"], last["id"])
+    return {"items": items, "next_cursor": next_cursor}
+
+
+async def count_unread(db: AsyncSession, employee_id: UUID) -> int:
+    # персональные покрываются частичным индексом ix_notifications_employees_unread
+    direct = await db.scalar(
+        select(func.count()).where(
+            NotificationsEmployees.id_employee == employee_id,
+            NotificationsEmployees.is_shown.is_(False),
+        )
+    )
+    broadcast = await db.scalar(
+        select(func.count()).select_from(Notifications).where(
+            _visible_broadcasts(employee_id),
+            ~_broadcast_read(employee_id),
+        )
+    )
+    return direct + broadcast
+
+
+async def mark_read(db: AsyncSession, employee_id: UUID, notification_ids: Optional[List[UUID]] = None) -> int:
+    """
+    Один UPDATE персональных и один INSERT ... SELECT отметок о прочтении рассылок;
+    без notification_ids — все непрочитанные сотрудника. Возвращает число отмеченных.
+    """
+    direct = (
+        update(NotificationsEmployees)
+            .where(
+                NotificationsEmployees.id_employee == employee_id,
+                NotificationsEmployees.is_shown.is_(False),
+            )
+            .values(is_shown=True)
+            .execution_options(synchronize_session=False)
+    )
+    unread_broadcasts = select(
+        Notifications.id,
+        literal(employee_id, PG_UUID(as_uuid=True)),
+        literal(datetime.utcnow(), DateTime()),
+    ).where(_visible_broadcasts(employee_id), ~_broadcast_read(employee_id))
+    if notification_ids is not None:
+        direct = direct.where(NotificationsEmployees.id_notification.in_(notification_ids))
+        unread_broadcasts = unread_broadcasts.where(Notifications.id.in_(notification_ids))
+
+    updated = (await db.execute(direct)).rowcount
+    updated += (await db.execute(
+        insert(NotificationReads)
+            .from_select(["id_notification", "id_employee", "read_at"], unread_broadcasts)
+            .on_conflict_do_nothing()
+    )).rowcount
+    await db.commit()
+    return updated
+
+
+def _fan_out_statement(notification_id: UUID, created_at: datetime, recipient_ids: List[UUID]):
+    # одна вставка INSERT ... SELECT; удалённые к этому моменту сотрудники просто отфильтруются
+    return insert(NotificationsEmployees).from_select(
+        ["id_notification", "id_employee", "is_shown", "created_at"],
+        select(
+            literal(notification_id, PG_UUID(as_uuid=True)),
+            Employers.id_employee,
+            false(),
+            literal(created_at, DateTime()),
+        ).where(Employers.id_employee == any_(
+            bindparam("recipient_ids", recipient_ids, type_=ARRAY(PG_UUID(as_uuid=True)))
+        ))
+    ).on_conflict_do_nothing()
+
+
+async def deliver_pending(db: AsyncSession, limit: int) -> int:
+    """
+    Разбирает до limit записей outbox. FOR UPDATE SKIP LOCKED позволяет нескольким воркерам
+    работать параллельно; каждая запись — в своём savepoint, чтобы ошибочная не блокировала остальные.
+    """
+    entries = (await db.execute(
+        select(
+            NotificationOutbox.id,
+            NotificationOutbox.id_notification,
+            NotificationOutbox.created_at,
+            NotificationOutbox.recipient_ids,
+        )
+            .where(NotificationOutbox.attempts < settings.NOTIFICATION_OUTBOX_MAX_ATTEMPTS)
+            .order_by(NotificationOutbox.created_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+    )).all()
+
+    for entry_id, notification_id, created_at, recipient_ids in entries:
+        try:
+            async with db.begin_nested():
+                await db.execute(_fan_out_statement(notification_id, created_at, recipient_ids))
+                await db.execute(delete(NotificationOutbox).where(NotificationOutbox.id == entry_id))
+                if settings.NOTIFICATION_PUSH_ENABLED:
+                    # NOTIFY уходит только при commit и отменяется вместе с savepoint
+                    await db.execute(select(func.pg_notify(settings.NOTIFICATION_PUSH_CHANNEL, str(notification_id))))
+        except SQLAlchemyError:
+            traceback.print_exc()
+            await db.execute(
+                update(NotificationOutbox)
+                    .where(NotificationOutbox.id == entry_id)
+                    .values(attempts=NotificationOutbox.attempts + 1)
+            )
+    await db.commit()
+    return len(entries)
+
+
+def wake_outbox_worker():
+    if _wakeup is not None and _loop is not None:
+        _loop.call_soon_threadsafe(_wakeup.set)
+
+
+async def run_outbox_worker():
+    """Фоновая доставка: сразу после commit с новой записью outbox, иначе раз в NOTIFICATION_OUTBOX_POLL_SECONDS."""
+    global _wakeup, _loop
+    _loop = asyncio.get_running_loop()
+    _wakeup = asyncio.Event()
+    batch_size = settings.NOTIFICATION_OUTBOX_BATCH_SIZE
+
+    while True:
+        _wakeup.clear()
+        try:
+            async with AsyncSessionLocal() as db:
+                processed = await deliver_pending(db, batch_size)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            traceback.print_exc()
+            processed = 0
+
+        if processed < batch_size:
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=settings.NOTIFICATION_OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_after_commit(session):
+    if session.info.pop(_PENDING_KEY, False):
+        wake_outbox_worker()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session):
+    session.info.pop(_PENDING_KEY, None)
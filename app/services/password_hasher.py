@@ -0,0 +1,112 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+from app.core.config import settings
+from app.core.metrics import LatencyHistogram
+
+# min/max совпадают с default: хэши с другой стоимостью помечаются на пересчёт при входе
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=settings.BCRYPT_ROUNDS,
+)
+
+
+class PasswordHasher:
+    """
+    Отдельный ограниченный пул потоков для bcrypt (bcrypt отпускает GIL).
+
+    Вход не занимает общий threadpool Starlette. Если в очереди уже PASSWORD_HASH_MAX_PENDING задач,
+    новая сразу получает 503 вместо ожидания. Собирает глубину очереди, ожидание и время хэширования.
+    """
+
+    def __init__(self, context: CryptContext, workers: int, max_pending: int):
+        self._context = context
+        self._workers = workers
+        self._max_pending = max_pending
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._completed = 0
+        self._rejected = 0
+        self._queue_wait = LatencyHistogram()
+        self._latency = LatencyHistogram()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # пул создаётся лениво, чтобы не переживать fork воркеров
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self._workers, thread_name_prefix="password-hash"
+                    )
+        return self._executor
+
+    def _submit(self, fn, *args) -> Future:
+        with self._lock:
+            if self._pending >= self._max_pending:
+                self._rejected += 1
+                raise HTTPException(
+                    status_code=503,
+                    detail="Login service is busy. Try again later.",
+                    headers={"Retry-After": "1"}
+                )
+            self._pending += 1
+
+        queued_at = time.monotonic()
+
+        def run():
+            started = time.monotonic()
+            self._queue_wait.observe(started - queued_at)
+            try:
+                return fn(*args)
+            finally:
+                self._latency.observe(time.monotonic() - started)
+
+        def done(_):
+            with self._lock:
+                self._pending -= 1
+                self._completed += 1
+
+        future = self._get_executor().submit(run)
+        future.add_done_callback(done)
+        return future
+
+    async def verify_and_update(self, plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        return await asyncio.wrap_future(
+            self._submit(self._context.verify_and_update, plain_password, hashed_password)
+        )
+
+    async def hash(self, password: str) -> str:
+        return await asyncio.wrap_future(self._submit(self._context.hash, password))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counters = {
+                "workers": self._workers,
+                "max_pending": self._max_pending,
+                "pending": self._pending,
+                "queued": max(0, self._pending - self._workers),
+                "completed": self._completed,
+                "rejected": self._rejected,
+            }
+        return {
+            **counters,
+            "queue_wait": self._queue_wait.snapshot(),
+            "latency": self._latency.snapshot(),
+        }
+
+
+password_hasher = PasswordHasher(
+    pwd_context,
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING,
+)
@@ -0,0 +1,69 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional, Tuple
+from uuid import UUID
+
+from app.core.config import settings
+
+
+class Principal(NamedTuple):
+    username: str
+    id_employee: UUID
+    role_id: UUID
+
+
+class PrincipalCache:
+    """
+    Ограниченный LRU-кэш с TTL: username -> Principal.
+
+    Хранит только идентификаторы (не ORM-объекты), поэтому его можно разделять между сессиями.
+    Дополнительно помнит, когда субъект был инвалидирован, чтобы не доверять claims
+    из токенов, выпущенных до этого момента.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: int):
+        self._max_size = max_size
+        self._ttl = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[Principal, float]]" = OrderedDict()
+        self._invalidated_at: "OrderedDict[str, float]" = OrderedDict()
+
+    def get(self, username: str) -> Optional[Principal]:
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None:
+                return None
+            principal, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[username]
+                return None
+            self._entries.move_to_end(username)
+            return principal
+
+    def put(self, principal: Principal):
+        with self._lock:
+            self._entries[principal.username] = (principal, time.monotonic() + self._ttl)
+            self._entries.move_to_end(principal.username)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def invalidated_since(self, username: str, issued_at: float) -> bool:
+        with self._lock:
+            invalidated_at = self._invalidated_at.get(username)
+        return invalidated_at is not None and invalidated_at >= issued_at
+
+    def invalidate(self, *usernames: str):
+        now = time.time()
+        with self._lock:
+            for username in usernames:
+                self._entries.pop(username, None)
+                self._invalidated_at[username] = now
+                self._invalidated_at.move_to_end(username)
+            # метки старше времени жизни токена уже ни на что не влияют
+            horizon = now - settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+            while self._invalidated_at and next(iter(self._invalidated_at.values())) < horizon:
+                self._invalidated_at.popitem(last=False)
+
+
+principal_cache = PrincipalCache(settings.PRINCIPAL_CACHE_SIZE, settings.PRINCIPAL_CACHE_TTL_SECONDS)
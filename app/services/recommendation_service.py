@@ -0,0 +1,154 @@
+from datetime import date
+from typing import Iterable, List, Tuple
+from uuid import UUID
+
+from sqlalchemy import select, delete, func, literal_column, union_all, case, and_, or_, exists, text, values, column, \
+    String, Uuid
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.models import (
+    Employers, Events, EventEmployers, EventGroupAttendance, InterestsEmployers, ProjectsEmployers
+)
+
+
+def employee_groups():
+    """
+    (id_employee, group_kind, id_group) — проекты, отдел и интересы сотрудника.
+    Без DISTINCT, чтобы условие по сотруднику доходило до индексов каждой ветки;
+    сотрудник с несколькими ролями в проекте встречается несколько раз — считаем через count(DISTINCT).
+    """
+    return union_all(
+        select(
+            ProjectsEmployers.id_employee,
+            literal_column("'project'").label("group_kind"),
+            ProjectsEmployers.id_project.label("id_group"),
+        ),
+        select(Employers.id_employee, literal_column("'department'"), Employers.id_department)
+            .where(Employers.id_department.isnot(None)),
+        select(InterestsEmployers.id_employee, literal_column("'interest'"), InterestsEmployers.id_interest),
+    ).subquery("employee_groups")
+
+
+def _group_weight(group_kind):
+    return case(
+        {
+            "project": settings.RECOMMENDATION_WEIGHT_PROJECT,
+            "interest": settings.RECOMMENDATION_WEIGHT_INTEREST,
+            "department": settings.RECOMMENDATION_WEIGHT_DEPARTMENT,
+        },
+        value=group_kind,
+        else_=0,
+    )
+
+
+def shift_group_attendance(changed, sign: int):
+    """
+    CTE для запросов join/leave: changed — строки (id_event, id_employee), вставленные или удалённые
+    из event_employers; счётчики групп этих сотрудников сдвигаются одним upsert-ом.
+    """
+    groups = employee_groups()
+    stmt = insert(EventGroupAttendance).from_select(
+        ["id_event", "group_kind", "id_group", "attendees"],
+        select(
+            changed.c.id_event, groups.c.group_kind, groups.c.id_group,
+            func.count(changed.c.id_employee.distinct()) * sign,
+        )
+            .join(groups, groups.c.id_employee == changed.c.id_employee)
+            .group_by(changed.c.id_event, groups.c.group_kind, groups.c.id_group)
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[EventGroupAttendance.id_event, EventGroupAttendance.group_kind, EventGroupAttendance.id_group],
+        set_={"attendees": EventGroupAttendance.attendees + stmt.excluded.attendees},
+    )
+    return stmt.cte("group_attendance")
+
+
+def shift_group_membership(memberships: Iterable[Tuple[UUID, str, UUID]], sign: int):
+    """
+    Сдвиг счётчиков при смене отдела, проектов или интересов: memberships — тройки
+    (id_employee, group_kind, id_group), в которые сотрудник вошёл (sign=1) или из которых вышел (sign=-1).
+    Затрагиваются только предстоящие мероприятия этих сотрудников; результат не зависит от того,
+    выполнен запрос до или после изменения самих связей. Вызывающий проверяет, что memberships не пуст.
+    """
+    changed = values(
+        column("id_employee", Uuid), column("group_kind", String), column("id_group", Uuid),
+        name="changed_groups",
+    ).data(list(memberships))
+    stmt = insert(EventGroupAttendance).from_select(
+        ["id_event", "group_kind", "id_group", "attendees"],
+        select(
+            EventEmployers.id_event, changed.c.group_kind, changed.c.id_group,
+            func.count(EventEmployers.id_employee.distinct()) * sign,
+        )
+            .join(changed, changed.c.id_employee == EventEmployers.id_employee)
+            .join(Events, Events.id_event == EventEmployers.id_event)
+            .where(Events.date >= date.today())
+            .group_by(EventEmployers.id_event, changed.c.group_kind, changed.c.id_group)
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[EventGroupAttendance.id_event, EventGroupAttendance.group_kind, EventGroupAttendance.id_group],
+        set_={"attendees": EventGroupAttendance.attendees + stmt.excluded.attendees},
+    )
+
+
+async def recommend_events(db: AsyncSession, employee_id: UUID, limit: int) -> List[Tuple[UUID, int]]:
+    """
+    Предстоящие мероприятия, где больше всего коллег сотрудника: сумма по его группам
+    «участников из группы × вес группы». Читаются только счётчики его групп, без соединения сотрудников между собой.
+    Мероприятия, где он уже участвует или организатор, исключаются.
+    """
+    groups = employee_groups()
+    my_groups = (
+        select(groups.c.group_kind, groups.c.id_group)
+            .where(groups.c.id_employee == employee_id)
+            .distinct()
+            .subquery()
+    )
+    score = func.sum(EventGroupAttendance.attendees * _group_weight(EventGroupAttendance.group_kind))
+    rows = (await db.execute(
+        select(EventGroupAttendance.id_event, score.label("score"))
+            .join(my_groups, and_(
+                EventGroupAttendance.group_kind == my_groups.c.group_kind,
+                EventGroupAttendance.id_group == my_groups.c.id_group,
+            ))
+            .join(Events, Events.id_event == EventGroupAttendance.id_event)
+            .where(
+                EventGroupAttendance.attendees > 0,
+                Events.date >= date.today(),
+                or_(Events.id_owner.is_(None), Events.id_owner != employee_id),
+                ~exists().where(
+                    EventEmployers.id_event == EventGroupAttendance.id_event,
+                    EventEmployers.id_employee == employee_id,
+                ),
+            )
+            .group_by(EventGroupAttendance.id_event)
+            .order_by(score.desc(), EventGroupAttendance.id_event)
+            .limit(limit)
+    )).all()
+    return [(event_id, score) for event_id, score in rows]
+
+
+def rebuild_group_attendance(db: Session):
+    """
+    Полный пересчёт счётчиков по event_employers для предстоящих мероприятий — только при bootstrap.
+    Дальше счётчики ведут join/leave и смена групп сотрудника (shift_group_membership).
+    Прошедшие мероприятия из таблицы уходят.
+    """
+    # join/leave уже запущенных экземпляров ждут: иначе их сдвиг счётчика потерялся бы между DELETE и INSERT
+    db.execute(text("LOCK TABLE event_employers IN SHARE MODE"))
+    db.execute(delete(EventGroupAttendance))
+    groups = employee_groups()
+    db.execute(insert(EventGroupAttendance).from_select(
+        ["id_event", "group_kind", "id_group", "attendees"],
+        select(
+            EventEmployers.id_event, groups.c.group_kind, groups.c.id_group,
+            func.count(EventEmployers.id_employee.distinct()),
+        )
+            .join(groups, groups.c.id_employee == EventEmployers.id_employee)
+            .join(Events, Events.id_event == EventEmployers.id_event)
+            .where(Events.date >= date.today())
+            .group_by(EventEmployers.id_event, groups.c.group_kind, groups.c.id_group)
+    ))
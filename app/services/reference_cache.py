@@ -0,0 +1,164 @@
+import threading
+import time
+from itertools import chain
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.models import (
+    Positions, Departments, Ranks, Roles, EventTypes, Technologies, Interests, Projects
+)
+
+# name -> (модель, первичный ключ, поле сортировки, отдаваемые поля)
+REFERENCE_TABLES: Dict[str, Tuple[Any, str, str, Tuple[str, ...]]] = {
+    "positions": (Positions, "id_position", "position_name", ("id_position", "position_name")),
+    "departments": (Departments, "id_department", "name_department", ("id_department", "name_department")),
+    "ranks": (Ranks, "id_rank", "name_rank", ("id_rank", "name_rank")),
+    "roles": (Roles, "id_role", "name_role", ("id_role", "name_role", "description")),
+    "event_types": (EventTypes, "id_event_type", "name_type", ("id_event_type", "name_type")),
+    "technologies": (Technologies, "id_technology", "name_technology",
+                     ("id_technology", "name_technology", "description")),
+    "interests": (Interests, "id_interest", "name_interest", ("id_interest", "name_interest")),
+    "projects": (Projects, "id_project", "name_project", ("id_project", "name_project", "description")),
+}
+REFERENCE_MODELS = {model: name for name, (model, *_rest) in REFERENCE_TABLES.items()}
+
+# не перечитываем таблицу чаще, чем раз в секунду, из-за промахов по id
+MISS_RELOAD_INTERVAL_SECONDS = 1.0
+
+
+class ReferenceTable(NamedTuple):
+    rows: Tuple[Dict[str, Any], ...]
+    by_id: Dict[Any, Dict[str, Any]]
+    version: int
+    loaded_at: float
+    ttl: float
+
+
+class ReferenceCache:
+    """
+    Процессный кэш маленьких справочников.
+
+    Каждая таблица хранится неизменяемым снимком из словарей (не ORM-объектов, чтобы не зависеть от сессии).
+    Снимок перечитывается, если его версия устарела (запись в таблицу в этом процессе),
+    истёк TTL (записи из других воркеров) или запрошен id, которого в снимке нет.
+    Методы с префиксом a — для AsyncSession: загрузка идёт через run_sync той же сессии.
+    """
+
+    def __init__(self, ttl_seconds: int):
+        self._ttl = ttl_seconds
+        self._lock = threading.Lock()
+        self._tables: Dict[str, ReferenceTable] = {}
+        self._versions: Dict[str, int] = {name: 0 for name in REFERENCE_TABLES}
+
+    def version(self, name: str) -> int:
+        return self._versions[name]
+
+    def invalidate(self, *names: str):
+        with self._lock:
+            for name in names or tuple(REFERENCE_TABLES):
+                self._versions[name] += 1
+
+    def get(self, db: Session, name: str) -> ReferenceTable:
+        table = self._tables.get(name)
+        if table is None or not self._is_fresh(name, table):
+            table = self._load(db, name, stale=table)
+        return table
+
+    def rows(self, db: Session, name: str):
+        return self.get(db, name).rows
+
+    def lookup(self, db: Session, name: str, key) -> Optional[Dict[str, Any]]:
+        if key is None:
+            return None
+        table = self.get(db, name)
+        row = table.by_id.get(key)
+        if row is None and time.monotonic() - table.loaded_at > MISS_RELOAD_INTERVAL_SECONDS:
+            self.invalidate(name)
+            row = self.get(db, name).by_id.get(key)
+        return row
+
+    async def aget(self, db: AsyncSession, name: str) -> ReferenceTable:
+        table = self._tables.get(name)
+        if table is None or not self._is_fresh(name, table):
+            table = await db.run_sync(self._load, name, table)
+        return table
+
+    async def arows(self, db: AsyncSession, name: str):
+        return (await self.aget(db, name)).rows
+
+    async def alookup(self, db: AsyncSession, name: str, key) -> Optional[Dict[str, Any]]:
+        if key is None:
+            return None
+        table = await self.aget(db, name)
+        row = table.by_id.get(key)
+        if row is None and time.monotonic() - table.loaded_at > MISS_RELOAD_INTERVAL_SECONDS:
+            self.invalidate(name)
+            row = (await self.aget(db, name)).by_id.get(key)
+        return row
+
+    def _is_fresh(self, name: str, table: ReferenceTable) -> bool:
+        return (
+            table.version == self._versions[name]
+            and time.monotonic() - table.loaded_at < table.ttl
+        )
+
+    def _load(self, db: Session, name: str, stale: Optional[ReferenceTable]) -> ReferenceTable:
+        with self._lock:
+            current = self._tables.get(name)
+            if current is not None and current is not stale and self._is_fresh(name, current):
+                return current
+            version = self._versions[name]
+
+        model, pk, order_by, fields = REFERENCE_TABLES[name]
+        columns = [getattr(model, field) for field in fields]
+        rows = tuple(
+            dict(zip(fields, values))
+            for values in db.query(*columns).order_by(getattr(model, order_by)).all()
+        )
+        ttl = self._ttl
+        if db.info.get("replica") and stale is not None and stale.version != version:
+            # перечитали с реплики сразу после записи — она может отставать, поэтому снимок живёт недолго
+            ttl = min(ttl, settings.READ_YOUR_WRITES_SECONDS)
+        table = ReferenceTable(
+            rows=rows,
+            by_id={row[pk]: row for row in rows},
+            version=version,
+            loaded_at=time.monotonic(),
+            ttl=ttl,
+        )
+        with self._lock:
+            # за время загрузки таблицу могли изменить — такой снимок сразу считается устаревшим
+            self._tables[name] = table
+        return table
+
+
+reference_cache = ReferenceCache(settings.REFERENCE_CACHE_TTL_SECONDS)
+
+_TOUCHED_KEY = "reference_tables_touched"
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_reference_writes(session, flush_context):
+    touched = {
+        REFERENCE_MODELS[type(obj)]
+        for obj in chain(session.new, session.dirty, session.deleted)
+        if type(obj) in REFERENCE_MODELS
+    }
+    if touched:
+        session.info.setdefault(_TOUCHED_KEY, set()).update(touched)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_reference_writes(session):
+    touched = session.info.pop(_TOUCHED_KEY, None)
+    if touched:
+        reference_cache.invalidate(*touched)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_reference_writes(session):
+    session.info.pop(_TOUCHED_KEY, None)
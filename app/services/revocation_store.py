@@ -0,0 +1,239 @@
+import asyncio
+import hashlib
+import math
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.models import RevokedTokens
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float):
+        size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self._size = max(size, 8)
+        self._hashes = max(1, round(self._size / capacity * math.log(2)))
+        self._bits = bytearray((self._size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self._size for i in range(self._hashes)]
+
+    def add(self, key: str):
+        if key in self:
+            return
+        for pos in self._positions(key):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class DatabaseRevocationBackend:
+    """Таблица revoked_tokens — общая для всех воркеров."""
+
+    def add(self, db: Session, jti: str, expires_at: datetime):
+        db.merge(RevokedTokens(jti=jti, expires_at=expires_at, revoked_at=datetime.utcnow()))
+        db.commit()
+
+    def stage(self, db: Session, jtis: List[str], expires_at: datetime):
+        # без коммита: запись фиксируется транзакцией вызывающего кода
+        stmt = insert(RevokedTokens).values([
+            {"jti": jti, "expires_at": expires_at, "revoked_at": datetime.utcnow()} for jti in jtis
+        ])
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[RevokedTokens.jti],
+            set_={"expires_at": stmt.excluded.expires_at, "revoked_at": stmt.excluded.revoked_at},
+        ))
+
+    def contains(self, db: Session, jti: str) -> bool:
+        return db.query(RevokedTokens.jti).filter(
+            RevokedTokens.jti == jti,
+            RevokedTokens.expires_at > datetime.utcnow()
+        ).first() is not None
+
+    def revoked_since(self, db: Session, since: datetime) -> Iterable[str]:
+        rows = db.query(RevokedTokens.jti).filter(RevokedTokens.revoked_at >= since).all()
+        return [jti for (jti,) in rows]
+
+    def active(self, db: Session) -> Iterable[str]:
+        rows = db.query(RevokedTokens.jti).filter(RevokedTokens.expires_at > datetime.utcnow()).all()
+        return [jti for (jti,) in rows]
+
+    def purge_expired(self, db: Session):
+        db.query(RevokedTokens).filter(
+            RevokedTokens.expires_at <= datetime.utcnow()
+        ).delete(synchronize_session=False)
+        db.commit()
+
+
+class MemoryRevocationBackend:
+    """Локальная замена для разработки и одного процесса: между воркерами не разделяется."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[datetime, datetime]] = {}
+
+    def add(self, db: Session, jti: str, expires_at: datetime):
+        with self._lock:
+            self._entries[jti] = (expires_at, datetime.utcnow())
+
+    def stage(self, db: Session, jtis: List[str], expires_at: datetime):
+        now = datetime.utcnow()
+        with self._lock:
+            for jti in jtis:
+                self._entries[jti] = (expires_at, now)
+
+    def contains(self, db: Session, jti: str) -> bool:
+        entry = self._entries.get(jti)
+        return entry is not None and entry[0] > datetime.utcnow()
+
+    def revoked_since(self, db: Session, since: datetime) -> Iterable[str]:
+        with self._lock:
+            return [jti for jti, (_, revoked_at) in self._entries.items() if revoked_at >= since]
+
+    def active(self, db: Session) -> Iterable[str]:
+        now = datetime.utcnow()
+        with self._lock:
+            return [jti for jti, (expires_at, _) in self._entries.items() if expires_at > now]
+
+    def purge_expired(self, db: Session):
+        now = datetime.utcnow()
+        with self._lock:
+            for jti in [jti for jti, (expires_at, _) in self._entries.items() if expires_at <= now]:
+                del self._entries[jti]
+
+
+def subject_key(username: str) -> str:
+    """Ключ отзыва по субъекту — в одном пространстве с jti, которые не содержат ':'."""
+    return f"sub:{username}"
+
+
+class RevocationStore:
+    """
+    Список отозванных токенов с Bloom-фильтром в памяти процесса.
+
+    Отрицательный ответ фильтра означает «не отозван» без обращения к хранилищу;
+    положительный перепроверяется в backend. Фильтр догружает новые отзывы
+    раз в REVOCATION_SYNC_SECONDS (отзыв на другом воркере виден с такой задержкой)
+    и раз в REVOCATION_REBUILD_SECONDS пересобирается без истёкших токенов.
+    """
+
+    def __init__(self, backend, sync_seconds: int, rebuild_seconds: int, capacity: int, error_rate: float):
+        self._backend = backend
+        self._sync_seconds = sync_seconds
+        self._rebuild_seconds = rebuild_seconds
+        self._capacity = capacity
+        self._error_rate = error_rate
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._bloom = BloomFilter(capacity, error_rate)
+        self._synced_at = 0.0
+        self._rebuilt_at = 0.0
+        self._synced_until = datetime.min
+
+    def revoke(self, db: Session, jti: str, expires_at: datetime):
+        self._backend.add(db, jti, expires_at)
+        with self._lock:
+            self._bloom.add(jti)
+
+    def revoke_subjects(self, db: Session, usernames: List[str]):
+        """
+        Отзыв всех токенов пользователей (удаление сотрудника) в транзакции вызывающего кода.
+        Запись живёт ACCESS_TOKEN_EXPIRE_MINUTES — дольше не живёт ни один выпущенный до неё токен.
+        """
+        if not usernames:
+            return
+        keys = [subject_key(username) for username in usernames]
+        expires_at = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+        self._backend.stage(db, keys, expires_at)
+        with self._lock:
+            for key in keys:
+                self._bloom.add(key)
+
+    def is_revoked(self, db: Session, jti: str) -> bool:
+        self._maybe_sync(db)
+        if jti not in self._bloom:
+            return False
+        return self._backend.contains(db, jti)
+
+    def purge_expired(self, db: Session):
+        self._backend.purge_expired(db)
+
+    def _maybe_sync(self, db: Session):
+        if time.monotonic() - self._synced_at < self._sync_seconds:
+            return
+        # синхронизирует один запрос; остальные не ждут его (под run_sync это заблокировало бы цикл событий)
+        # и отвечают по текущему фильтру
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            self._sync(db)
+        finally:
+            self._sync_lock.release()
+
+    def _sync(self, db: Session):
+        now = time.monotonic()
+        if now - self._synced_at < self._sync_seconds:
+            return
+        # перекрытие окна покрывает расхождение часов между воркерами
+        wall_now = datetime.utcnow() - timedelta(seconds=2 * self._sync_seconds)
+
+        # запросы к backend — вне self._lock, под ним только замена фильтра
+        if now - self._rebuilt_at >= self._rebuild_seconds or self._bloom.count > self._capacity:
+            bloom = BloomFilter(self._capacity, self._error_rate)
+            for jti in self._backend.active(db):
+                bloom.add(jti)
+            with self._lock:
+                self._bloom = bloom
+                self._rebuilt_at = now
+        else:
+            revoked = self._backend.revoked_since(db, self._synced_until)
+            with self._lock:
+                for jti in revoked:
+                    self._bloom.add(jti)
+
+        self._synced_until = wall_now
+        self._synced_at = now
+
+
+async def run_revocation_purge():
+    """
+    Фоновое удаление истёкших отзывов раз в REVOCATION_REBUILD_SECONDS.
+    Не в запросе авторизации: коммит пометил бы запрос как пишущий и закрепил его чтения за primary.
+    """
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.run_sync(revocation_store.purge_expired)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            traceback.print_exc()
+        await asyncio.sleep(settings.REVOCATION_REBUILD_SECONDS)
+
+
+def _create_backend():
+    if settings.REVOCATION_BACKEND == "memory":
+        return MemoryRevocationBackend()
+    return DatabaseRevocationBackend()
+
+
+revocation_store = RevocationStore(
+    _create_backend(),
+    sync_seconds=settings.REVOCATION_SYNC_SECONDS,
+    rebuild_seconds=settings.REVOCATION_REBUILD_SECONDS,
+    capacity=settings.REVOCATION_BLOOM_CAPACITY,
+    error_rate=settings.REVOCATION_BLOOM_ERROR_RATE,
+)
@@ -1,34 +1,40 @@
+import hashlib
 import math
+import uuid
+from collections import defaultdict
 from datetime import datetime, timedelta
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterable, List
 from uuid import UUID
 
 import jwt
 from fastapi import Depends, HTTPException, status, Security
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from passlib.context import CryptContext
 
 from typing import Optional
 
-from sqlalchemy import or_, distinct, func
+from sqlalchemy import or_, func, select, exists
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.models.models import (
     Interests,
     Technologies, Ranks,
     Projects, Roles,
-    Positions, Departments, Employers, Notifications, NotificationsEmployees
+    Positions, Departments, Employers, Notifications, NotificationsEmployees, NotificationReads, EventEmployers,
+    SystemRoles
 )
 from app.core.config import settings
-from app.db.get_db import get_db
+from app.db.get_db import get_async_db
 from app.models.models import Users, InterestsEmployers, TechnologyEmployee, ProjectsEmployers
+from app.services.city_service import apply_city_changes
+from app.services.event_service import detach_attendees_statement
+from app.services.password_hasher import pwd_context
+from app.services.principal_cache import Principal, principal_cache
+from app.services.reference_cache import reference_cache
+from app.services.revocation_store import revocation_store, subject_key
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
-failed_attempts_cache = {}
-token_blacklist = set()
-
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
@@ -40,21 +46,60 @@ def get_password_hash(password: str) -> str:
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
+    now = datetime.utcnow()
     if expires_delta:
-        expire = datetime.utcnow() + expires_delta
+        expire = now + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+        expire = now + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    to_encode.update({"exp": expire, "iat": now, "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
 
+def create_user_access_token(user: Users) -> str:
+    return create_access_token(data={
+        "sub": user.username,
+        "eid": str(user.employee_id),
+        "rid": str(user.role_id),
+    })
+
+
+def token_id(token: str, payload: Dict[str, Any]) -> str:
+    # у токенов, выпущенных до появления jti, идентификатором служит хэш самого токена
+    return payload.get("jti") or hashlib.sha256(token.encode()).hexdigest()
+
+
+def principal_from_claims(payload: Dict[str, Any]) -> Optional[Principal]:
+    if "eid" not in payload or "rid" not in payload or "iat" not in payload:
+        return None
+    if principal_cache.invalidated_since(payload["sub"], payload["iat"]):
+        return None
+    try:
+        return Principal(payload["sub"], UUID(payload["eid"]), UUID(payload["rid"]))
+    except (TypeError, ValueError):
+        return None
+
+
+async def load_principal(db: AsyncSession, username: str, use_cache: bool = True) -> Optional[Principal]:
+    principal = principal_cache.get(username) if use_cache else None
+    if principal:
+        return principal
+
+    row = (await db.execute(
+        select(Users.username, Users.employee_id, Users.role_id)
+            .where(Users.username == username)
+    )).first()
+    if not row:
+        return None
+    principal = Principal(*row)
+    principal_cache.put(principal)
+    return principal
+
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Security(security),
-                           db: Session = Depends(get_db)):
+                           db: AsyncSession = Depends(get_async_db)):
     token = credentials.credentials
 
-    if token in token_blacklist:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token has been revoked")
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         username: str = payload.get("sub")
@@ -65,183 +110,151 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Security(
     except jwt.PyJWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
 
-    user = db.query(Users).filter(Users.username == username).first()
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-    return {"user": user, "employee": user.employee, "token": token, "role": user.role_id}
-
-
-def get_user_with_related(db: Session, username: str) -> Optional[Dict[str, Any]]:
-    user = db.query(Users).filter(Users.username == username).first()
-    if not user or not user.employee:
-        return None
+    if await db.run_sync(revocation_store.is_revoked, token_id(token, payload)):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token has been revoked")
 
-    emp = user.employee
-
-    # Basic employee fields
-    emp_data: Dict[str, Any] = {
-        "id_employee": emp.id_employee,
-        "first_name": emp.first_name,
-        "last_name": emp.last_name,
-        "middle_name": emp.middle_name,
-        "date_of_birth": emp.date_of_birth,
-        "email": emp.email,
-        "phone_number": emp.phone_number,
-        "telegram_name": emp.telegram_name,
-        "city": emp.city,
+    # отзыв по субъекту (удаление сотрудника) общий для всех воркеров, в отличие от principal_cache:
+    # ни claims, ни локальному кэшу такого пользователя не доверяем — только таблице users
+    subject_revoked = await db.run_sync(revocation_store.is_revoked, subject_key(username))
+    principal = None
+    if settings.PRINCIPAL_FROM_TOKEN_CLAIMS and not subject_revoked:
+        principal = principal_from_claims(payload)
+    if principal is None:
+        principal = await load_principal(db, username, use_cache=not subject_revoked)
+    if not principal:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    # "user" и "employee" — один и тот же Principal: у него есть username, role_id и id_employee
+    return {
+        "user": principal,
+        "employee": principal,
+        "token": token,
+        "token_id": token_id(token, payload),
+        "token_expires_at": datetime.utcfromtimestamp(payload["exp"]),
+        "role": principal.role_id,
     }
 
-    # position and department
-    position = db.query(Positions).get(emp.id_position)
-    department = db.query(Departments).get(emp.id_department)
-    emp_data["position"] = {
-        "id_position": position.id_position,
-        "position_name": position.position_name
-    } if position else None
-    emp_data["department"] = {
-        "id_department": department.id_department,
-        "name_department": department.name_department
-    } if department else None
-
-    # interests
-    interests = (
-        db.query(Interests)
-            .join(InterestsEmployers, Interests.id_interest == InterestsEmployers.id_interest)
-            .filter(InterestsEmployers.id_employee == emp.id_employee)
-            .all()
-    )
-    emp_data["interests"] = [
-        {"id_interest": i.id_interest, "name_interest": i.name_interest} for i in interests
-    ]
 
-    # technologies with rank
-    tech_rows = (
-        db.query(Technologies, Ranks)
-            .join(TechnologyEmployee, Technologies.id_technology == TechnologyEmployee.id_technology)
-            .join(Ranks, TechnologyEmployee.id_rank == Ranks.id_rank)
-            .filter(TechnologyEmployee.id_employee == emp.id_employee)
-            .all()
-    )
-    emp_data["technologies"] = [
-        {
-            "id_technology": tech.id_technology,
-            "name_technology": tech.name_technology,
-            "rank": {"id_rank": rank.id_rank, "name_rank": rank.name_rank}
-        }
-        for tech, rank in tech_rows
-    ]
+def _system_role_query(role_id: UUID, role_names: Iterable[str]):
+    return select(exists().where(
+        SystemRoles.id_role == role_id,
+        SystemRoles.role_name.in_(list(role_names)),
+    ))
 
-    # projects
-    proj_rows = (
-        db.query(Projects, Roles)
-            .join(ProjectsEmployers, Projects.id_project == ProjectsEmployers.id_project)
-            .join(Roles, ProjectsEmployers.id_role == Roles.id_role)
-            .filter(ProjectsEmployers.id_employee == emp.id_employee)
-            .all()
-    )
-    emp_data["projects"] = [
-        {
-            "id_project": proj.id_project,
-            "name_project": proj.name_project,
-            "role": {
-                "id_role": role.id_role,
-                "name_role": role.name_role
-            }
-        } for proj, role in proj_rows
-    ]
 
-    return {"username": user.username, "employee": emp_data}
+async def has_system_role(db: AsyncSession, role_id: UUID, role_names: Iterable[str]) -> bool:
+    return await db.scalar(_system_role_query(role_id, role_names))
 
 
-def get_employee_with_id(db: Session, id_employee: str) -> Optional[Dict[str, Any]]:
-    emp = db.query(Employers).filter(Employers.id_employee == id_employee).first()
-    if not emp:
-        return None
+def has_system_role_sync(db: Session, role_id: UUID, role_names: Iterable[str]) -> bool:
+    return db.scalar(_system_role_query(role_id, role_names))
 
-    # Basic employee fields
-    emp_data: Dict[str, Any] = {
-        "id_employee": emp.id_employee,
-        "first_name": emp.first_name,
-        "last_name": emp.last_name,
-        "middle_name": emp.middle_name,
-        "date_of_birth": emp.date_of_birth,
-        "email": emp.email,
-        "phone_number": emp.phone_number,
-        "telegram_name": emp.telegram_name,
-        "city": emp.city,
-    }
 
-    # position and department
-    position = db.query(Positions).get(emp.id_position)
-    department = db.query(Departments).get(emp.id_department)
-    emp_data["position"] = {
-        "id_position": position.id_position,
-        "position_name": position.position_name
-    } if position else None
-    emp_data["department"] = {
-        "id_department": department.id_department,
-        "name_department": department.name_department
-    } if department else None
-
-    # interests
-    interests = (
-        db.query(Interests)
-            .join(InterestsEmployers, Interests.id_interest == InterestsEmployers.id_interest)
-            .filter(InterestsEmployers.id_employee == emp.id_employee)
-            .all()
-    )
-    emp_data["interests"] = [
-        {"id_interest": i.id_interest, "name_interest": i.name_interest} for i in interests
-    ]
+async def get_employees_payload(db: AsyncSession, employees: List[Employers]) -> List[Dict[str, Any]]:
+    """
+    Собирает EmployeeRead-словари для списка сотрудников: по одному запросу на каждую связь
+    для всей пачки, названия берутся из справочников в reference_cache.
+    """
+    ids = [emp.id_employee for emp in employees]
+    if not ids:
+        return []
+
+    interests_by_emp: Dict[UUID, List[Dict[str, Any]]] = defaultdict(list)
+    interest_rows = (await db.execute(
+        select(InterestsEmployers.id_employee, InterestsEmployers.id_interest)
+            .where(InterestsEmployers.id_employee.in_(ids))
+    )).all()
+    for emp_id, interest_id in interest_rows:
+        interest = await reference_cache.alookup(db, "interests", interest_id)
+        if interest:
+            interests_by_emp[emp_id].append(interest)
 
     # technologies with rank
-    tech_rows = (
-        db.query(Technologies, Ranks)
-            .join(TechnologyEmployee, Technologies.id_technology == TechnologyEmployee.id_technology)
-            .join(Ranks, TechnologyEmployee.id_rank == Ranks.id_rank)
-            .filter(TechnologyEmployee.id_employee == emp.id_employee)
-            .all()
-    )
-    emp_data["technologies"] = [
-        {
-            "id_technology": tech.id_technology,
-            "name_technology": tech.name_technology,
-            "rank": {"id_rank": rank.id_rank, "name_rank": rank.name_rank}
-        }
-        for tech, rank in tech_rows
-    ]
+    techs_by_emp: Dict[UUID, List[Dict[str, Any]]] = defaultdict(list)
+    tech_rows = (await db.execute(
+        select(TechnologyEmployee.id_employee, TechnologyEmployee.id_technology, TechnologyEmployee.id_rank)
+            .where(TechnologyEmployee.id_employee.in_(ids))
+    )).all()
+    for emp_id, tech_id, rank_id in tech_rows:
+        tech = await reference_cache.alookup(db, "technologies", tech_id)
+        rank = await reference_cache.alookup(db, "ranks", rank_id)
+        if tech and rank:
+            techs_by_emp[emp_id].append({
+                "id_technology": tech["id_technology"],
+                "name_technology": tech["name_technology"],
+                "rank": rank
+            })
 
     # projects
-    proj_rows = (
-        db.query(Projects, Roles)
-            .join(ProjectsEmployers, Projects.id_project == ProjectsEmployers.id_project)
-            .join(Roles, ProjectsEmployers.id_role == Roles.id_role)
-            .filter(ProjectsEmployers.id_employee == emp.id_employee)
-            .all()
-    )
-    emp_data["projects"] = [
-        {
-            "id_project": proj.id_project,
-            "name_project": proj.name_project,
-            "role": {
-                "id_role": role.id_role,
-                "name_role": role.name_role
-            }
-        } for proj, role in proj_rows
-    ]
+    projects_by_emp: Dict[UUID, List[Dict[str, Any]]] = defaultdict(list)
+    proj_rows = (await db.execute(
+        select(ProjectsEmployers.id_employee, ProjectsEmployers.id_project, ProjectsEmployers.id_role)
+            .where(ProjectsEmployers.id_employee.in_(ids))
+    )).all()
+    for emp_id, project_id, role_id in proj_rows:
+        project = await reference_cache.alookup(db, "projects", project_id)
+        role = await reference_cache.alookup(db, "roles", role_id)
+        if project and role:
+            projects_by_emp[emp_id].append({
+                "id_project": project["id_project"],
+                "name_project": project["name_project"],
+                "role": {
+                    "id_role": role["id_role"],
+                    "name_role": role["name_role"]
+                }
+            })
+
+    result: List[Dict[str, Any]] = []
+    for emp in employees:
+        result.append({
+            "id_employee": emp.id_employee,
+            "first_name": emp.first_name,
+            "last_name": emp.last_name,
+            "middle_name": emp.middle_name,
+            "date_of_birth": emp.date_of_birth,
+            "email": emp.email,
+            "phone_number": emp.phone_number,
+            "telegram_name": emp.telegram_name,
+            "city": emp.city,
+            "position": await reference_cache.alookup(db, "positions", emp.id_position),
+            "department": await reference_cache.alookup(db, "departments", emp.id_department),
+            "interests": interests_by_emp[emp.id_employee],
+            "technologies": techs_by_emp[emp.id_employee],
+            "projects": projects_by_emp[emp.id_employee],
+        })
+
+    return result
+
+
+async def get_user_with_related(db: AsyncSession, username: str) -> Optional[Dict[str, Any]]:
+    row = (await db.execute(
+        select(Users.username, Employers)
+            .join(Employers, Employers.id_employee == Users.employee_id)
+            .where(Users.username == username)
+    )).first()
+    if not row:
+        return None
+
+    emp_data = (await get_employees_payload(db, [row.Employers]))[0]
+    return {"username": row.username, "employee": emp_data}
+
+
+async def get_employee_with_id(db: AsyncSession, id_employee: UUID) -> Optional[Dict[str, Any]]:
+    emp = await db.get(Employers, id_employee)
+    if not emp:
+        return None
 
-    return emp_data
+    return (await get_employees_payload(db, [emp]))[0]
 
 
-def get_employees_list(
-        db: Session,
+async def get_employees_list(
+        db: AsyncSession,
         *,
         str_to_find: Optional[str] = None,
         filters: Dict[str, Optional[List[str]]],
         skip: int = 0,
         limit: int = 10
 ) -> Dict[str, Any]:
-    query = db.query(Employers)
+    query = select(Employers)
 
     if str_to_find:
         pattern = f"%{str_to_find}%"
@@ -271,7 +284,7 @@ def get_employees_list(
             Projects.name_project.ilike(pattern),
             Roles.name_role.ilike(pattern),
         ]
-        query = query.filter(or_(*or_clauses))
+        query = query.where(or_(*or_clauses))
 
     text_fields = [
         ("first_name", Employers.first_name),
@@ -285,107 +298,39 @@ def get_employees_list(
     for key, column in text_fields:
         vals = filters.get(key)
         if vals:
-            query = query.filter(or_(*[column.ilike(f"%{v}%") for v in vals]))
+            query = query.where(or_(*[column.ilike(f"%{v}%") for v in vals]))
 
     if filters.get("id_position"):
-        query = query.filter(Employers.id_position.in_(filters["id_position"]))
+        query = query.where(Employers.id_position.in_(filters["id_position"]))
     if filters.get("id_department"):
-        query = query.filter(Employers.id_department.in_(filters["id_department"]))
+        query = query.where(Employers.id_department.in_(filters["id_department"]))
 
     if filters.get("id_interest"):
         query = (
             query
                 .join(InterestsEmployers, InterestsEmployers.id_employee == Employers.id_employee)
-                .filter(InterestsEmployers.id_interest.in_(filters["id_interest"]))
+                .where(InterestsEmployers.id_interest.in_(filters["id_interest"]))
         )
     if filters.get("id_technology"):
         query = (
             query
                 .join(TechnologyEmployee, TechnologyEmployee.id_employee == Employers.id_employee)
-                .filter(TechnologyEmployee.id_technology.in_(filters["id_technology"]))
+                .where(TechnologyEmployee.id_technology.in_(filters["id_technology"]))
         )
     if filters.get("id_project"):
         query = (
             query
                 .join(ProjectsEmployers, ProjectsEmployers.id_employee == Employers.id_employee)
-                .filter(ProjectsEmployers.id_project.in_(filters["id_project"]))
+                .where(ProjectsEmployers.id_project.in_(filters["id_project"]))
         )
 
     base_q = query.distinct(Employers.id_employee)
-    total_count = (
-        db.query(func.count(distinct(Employers.id_employee)))
-            .select_from(base_q.subquery())
-            .scalar()
-    )
+    total_count = await db.scalar(select(func.count()).select_from(base_q.subquery()))
     total_pages = math.ceil(total_count / limit) if limit > 0 else 1
 
-    employees = base_q.offset(skip).limit(limit).all()
-
-    result: List[Dict[str, Any]] = []
-    for emp in employees:
-        emp_data: Dict[str, Any] = {
-            "id_employee": emp.id_employee,
-            "first_name": emp.first_name,
-            "last_name": emp.last_name,
-            "middle_name": emp.middle_name,
-            "date_of_birth": emp.date_of_birth,
-            "email": emp.email,
-            "phone_number": emp.phone_number,
-            "telegram_name": emp.telegram_name,
-            "city": emp.city,
-        }
-
-        pos = db.query(Positions).get(emp.id_position)
-        dept = db.query(Departments).get(emp.id_department)
-        emp_data["position"] = {"id_position": pos.id_position, "position_name": pos.position_name} if pos else None
-        emp_data["department"] = {"id_department": dept.id_department,
-                                  "name_department": dept.name_department} if dept else None
-
-        ints = (
-            db.query(Interests)
-                .join(InterestsEmployers, Interests.id_interest == InterestsEmployers.id_interest)
-                .filter(InterestsEmployers.id_employee == emp.id_employee)
-                .all()
-        )
-        emp_data["interests"] = [{"id_interest": i.id_interest, "name_interest": i.name_interest} for i in ints]
-
-        techs = (
-            db.query(Technologies, Ranks)
-                .join(TechnologyEmployee, Technologies.id_technology == TechnologyEmployee.id_technology)
-                .join(Ranks, TechnologyEmployee.id_rank == Ranks.id_rank)
-                .filter(TechnologyEmployee.id_employee == emp.id_employee)
-                .all()
-        )
-        emp_data["technologies"] = [
-            {
-                "id_technology": t.id_technology,
-                "name_technology": t.name_technology,
-                "rank": {
-                    "id_rank": r.id_rank,
-                    "name_rank": r.name_rank
-                }
-            } for t, r in techs
-        ]
-
-        projs = (
-            db.query(Projects, Roles)
-                .join(ProjectsEmployers, Projects.id_project == ProjectsEmployers.id_project)
-                .join(Roles, ProjectsEmployers.id_role == Roles.id_role)
-                .filter(ProjectsEmployers.id_employee == emp.id_employee)
-                .all()
-        )
-        emp_data["projects"] = [
-            {
-                "id_project": p.id_project,
-                "name_project": p.name_project,
-                "role": {
-                    "id_role": rl.id_role,
-                    "name_role": rl.name_role
-                }
-            } for p, rl in projs
-        ]
+    employees = (await db.scalars(base_q.order_by(Employers.id_employee).offset(skip).limit(limit))).all()
 
-        result.append(emp_data)
+    result = await get_employees_payload(db, employees)
 
     return {
         "employees": result,
@@ -395,62 +340,61 @@ def get_employees_list(
 
 
 async def check_unique_fields(
-        db: Session,
-            employee_id: UUID = None,
+        db: AsyncSession,
+        employee_id: UUID = None,
         email: str = None,
         phone: str = None,
         telegram: str = None
 ):
     duplicated_fields = []
 
-    if email:
-        existing = db.query(Employers).filter(
-            Employers.email == email, Employers.id_employee != employee_id
-        ).first()
-        if existing:
-            duplicated_fields.append("email")
-
-    if phone:
-        existing = db.query(Employers).filter(
-            Employers.phone_number == phone, Employers.id_employee != employee_id
-        ).first()
-        if existing:
-            duplicated_fields.append("phone_number")
-
-    if telegram:
-        existing = db.query(Employers).filter(
-            Employers.telegram_name == telegram, Employers.id_employee != employee_id
-        ).first()
-        if existing:
-            duplicated_fields.append("telegram_name")
+    for field, column, value in (
+            ("email", Employers.email, email),
+            ("phone_number", Employers.phone_number, phone),
+            ("telegram_name", Employers.telegram_name, telegram),
+    ):
+        if not value:
+            continue
+        taken = await db.scalar(select(exists().where(column == value, Employers.id_employee != employee_id)))
+        if taken:
+            duplicated_fields.append(field)
 
     return duplicated_fields
 
 
-async def update_entity(db: Session, entity, entity_updated_data: Dict):
+async def update_entity(db: AsyncSession, entity, entity_updated_data: Dict):
     for field, value in entity_updated_data.items():
         setattr(entity, field, value)
 
-    db.commit()
-    db.refresh(entity)
+    await db.commit()
+    await db.refresh(entity)
 
     return entity
 
 
-def create_notification(db: Session, content: str, employee_ids: List[UUID]) -> UUID:
-    new_notif = Notifications(content=content)
-    db.add(new_notif)
-    db.flush()
-
-    for emp_id in employee_ids:
-        assoc = NotificationsEmployees(
-            id_notification=new_notif.id,
-            id_employee=emp_id,
-            is_shown=False
-        )
-        db.add(assoc)
-
-    db.commit()
-    db.refresh(new_notif)
-
-    return new_notif.id
+def delete_employees(db: Session, employee_ids: List[UUID]) -> int:
+    if not employee_ids:
+        return 0
+
+    cities = db.query(Employers.city).filter(Employers.id_employee.in_(employee_ids)).all()
+    apply_city_changes(db, removed=[city for (city,) in cities])
+    usernames = [username for (username,) in db.query(Users.username).filter(Users.employee_id.in_(employee_ids))]
+    principal_cache.invalidate(*usernames)
+    revocation_store.revoke_subjects(db, usernames)
+    db.execute(detach_attendees_statement(EventEmployers.id_employee.in_(employee_ids)))
+
+    for model, column in (
+            (InterestsEmployers, InterestsEmployers.id_employee),
+            (TechnologyEmployee, TechnologyEmployee.id_employee),
+            (ProjectsEmployers, ProjectsEmployers.id_employee),
+            (NotificationsEmployees, NotificationsEmployees.id_employee),
+            (NotificationReads, NotificationReads.id_employee),
+            (Users, Users.employee_id),
+    ):
+        db.query(model).filter(column.in_(employee_ids)).delete(synchronize_session=False)
+
+    return (
+        db.query(Employers)
+            .filter(Employers.id_employee.in_(employee_ids))
+            .delete(synchronize_session=False)
+    )
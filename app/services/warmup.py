@@ -0,0 +1,116 @@
+import asyncio
+import time
+import traceback
+from typing import Dict, Optional
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.core.database import (
+    engine, async_engine, replica_engine, async_replica_engine, AsyncReadSessionLocal, ReadSessionLocal
+)
+from app.services.reference_cache import REFERENCE_TABLES, reference_cache
+
+WARMUP_RETRY_SECONDS = 5
+
+
+class WarmupState:
+    """Прогрев воркера: пока он не завершён, readiness отвечает 503."""
+
+    def __init__(self):
+        self.ready = False
+        self.error: Optional[str] = None
+        self.steps: Dict[str, float] = {}
+        self._started_at = time.monotonic()
+
+    def step_done(self, name: str, started: float):
+        self.steps[name] = round((time.monotonic() - started) * 1000, 1)
+
+    def snapshot(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "error": self.error,
+            "steps_ms": dict(self.steps),
+            "uptime_seconds": round(time.monotonic() - self._started_at, 1),
+        }
+
+
+warmup_state = WarmupState()
+
+
+async def _preconnect_async(target_engine, count: int):
+    async def touch():
+        async with target_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+            # держим соединение, пока не откроются остальные, иначе пул будет раздавать одно и то же
+            await asyncio.sleep(0.05)
+
+    await asyncio.gather(*(touch() for _ in range(count)))
+
+
+def _preconnect_sync(target_engine, count: int):
+    connections = [target_engine.connect() for _ in range(count)]
+    for conn in connections:
+        conn.execute(text("SELECT 1"))
+        conn.close()
+
+
+def _warm_graphs():
+    from app.api.v1.graph import GRAPH_TYPES, get_structure
+
+    with ReadSessionLocal() as db:
+        for graph_type in GRAPH_TYPES:
+            get_structure(graph_type, db)
+
+
+async def _warm_reference_cache():
+    async with AsyncReadSessionLocal() as db:
+        for name in REFERENCE_TABLES:
+            await reference_cache.aget(db, name)
+
+
+async def _warm_hot_queries():
+    from app.services.event_service import list_events
+    from app.services.user_service import get_employees_list
+
+    async with AsyncReadSessionLocal() as db:
+        await get_employees_list(db, filters={}, skip=0, limit=10)
+        await get_employees_list(db, str_to_find="warmup", filters={}, skip=0, limit=10)
+        await list_events(db, search="", skip=0, limit=10)
+
+
+async def warm_up(state: WarmupState = warmup_state):
+    """
+    Открывает соединения пулов, загружает справочники и один раз выполняет горячие запросы
+    (графы, список сотрудников, мероприятия), чтобы SQLAlchemy скомпилировала и закэшировала их.
+    """
+    count = max(1, settings.DB_POOL_SIZE)
+    steps = [
+        ("pool", lambda: _preconnect_async(async_engine, count)),
+        ("pool_sync", lambda: asyncio.to_thread(_preconnect_sync, engine, count)),
+    ]
+    if replica_engine is not engine:
+        steps += [
+            ("replica_pool", lambda: _preconnect_async(async_replica_engine, count)),
+            ("replica_pool_sync", lambda: asyncio.to_thread(_preconnect_sync, replica_engine, count)),
+        ]
+    steps += [
+        ("reference_cache", _warm_reference_cache),
+        ("graphs", lambda: asyncio.to_thread(_warm_graphs)),
+        ("hot_queries", _warm_hot_queries),
+    ]
+
+    for name, step in steps:
+        started = time.monotonic()
+        while True:
+            try:
+                await step()
+                break
+            except Exception as exc:
+                # БД может подняться позже воркера — повторяем шаг, пока readiness отвечает 503
+                traceback.print_exc()
+                state.error = f"{name}: {exc.__class__.__name__}"
+                await asyncio.sleep(WARMUP_RETRY_SECONDS)
+        state.step_done(name, started)
+    state.error = None
+    state.ready = True